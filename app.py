@@ -1,44 +1,104 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, session, jsonify, g
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import wraps, lru_cache
 import pytz
-import sqlite3
-import requests
-import hashlib
+import csv
+import io
+import json
 import os
+import time
+import hmac
 import logging
+import repository
+import metrics
+import migrations
+import outbox
+import passwords
+import assets
+import profiling
+import ratelimit
+from werkzeug.middleware.proxy_fix import ProxyFix
+from page_cache import PageCache
+
+
+@lru_cache(maxsize=None)
+def local_timezone():
+    """Часовой пояс сервиса. Первый pytz.timezone() проверяет файлы всех зон (~15 мс),
+    поэтому он вызывается при первом запросе, а не в create_app()"""
+    return pytz.timezone('Europe/Moscow')
 
 
 # Инициализация Flask приложения
 def create_app():
     app = Flask(__name__)
 
-    # Установка часового пояса
-    timezone = pytz.timezone('Europe/Moscow')
+    # Сдвиг часового пояса для SQL: время форматируется в запросе, а не по строке в Python
+    def timezone_modifier():
+        offset = local_timezone().utcoffset(datetime.utcnow())
+        return f'{int(offset.total_seconds() // 60):+d} minutes'
 
-    def format_timestamp(timestamp):
-        if not timestamp:
-            return "Нет данных"
-        try:
-            timestamp_obj = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-            localized_time = timezone.localize(timestamp_obj)
-            formatted_time = localized_time.strftime('%d.%m.%Y %H:%M:%S')
-            return formatted_time
-        except ValueError as e:
-            app.logger.error(f"Ошибка форматирования времени: {e}")
-            return "Ошибка формата времени"
+    # Перевод даты 'YYYY-MM-DD' (по местному времени) в UTC-строку для сравнения с orders.timestamp
+    def to_utc(date_string, days=0):
+        local_time = local_timezone().localize(datetime.strptime(date_string, '%Y-%m-%d') + timedelta(days=days))
+        return local_time.astimezone(pytz.utc).strftime('%Y-%m-%d %H:%M:%S')
 
     load_dotenv()  # Загружаем переменные окружения из .env
 
     ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
+    ADMIN_PAGE_SIZE = 50
+    ADMIN_MAX_PAGE_SIZE = 500
+    # Период сводки в /admin/stats, если даты не заданы
+    ADMIN_STATS_DAYS = 30
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
     TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
+    # Если задан, /metrics требует заголовок "Authorization: Bearer <METRICS_TOKEN>";
+    # без него метрики доступны только с локального адреса и администратору
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # Сколько прокси перед приложением дописывают X-Forwarded-For (на Render — один балансировщик).
+    # Без прокси заголовку верить нельзя: клиент подставит любой IP и обойдёт ограничение частоты
+    IS_RENDER = os.getenv('IS_RENDER', 'false').lower() == 'true'
+    TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '1' if IS_RENDER else '0'))
 
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         raise ValueError("Необходимо указать TELEGRAM_BOT_TOKEN и TELEGRAM_CHAT_ID в .env файле")
 
     app.secret_key = os.getenv('FLASK_SECRET_KEY', os.urandom(24))
+    if TRUSTED_PROXY_HOPS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+
+    # Адаптивные изображения из манифеста build_assets.py
+    assets.init_app(app)
+
+    # Кэш страниц услуг: их HTML зависит только от статуса авторизации
+    page_cache = PageCache(app)
+    app.extensions['page_cache'] = page_cache
+
+    # Время обработки запросов по маршрутам для /metrics
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.http_request_duration.observe(
+                time.perf_counter() - started, route, request.method, str(response.status_code)
+            )
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if METRICS_TOKEN:
+            allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}')
+        else:
+            allowed = request.remote_addr in ('127.0.0.1', '::1') or session.get('is_admin')
+        if not allowed:
+            return 'Unauthorized', 401
+        return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
 
     # Настройка Flask-Login
     login_manager = LoginManager()
@@ -49,47 +109,14 @@ def create_app():
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
 
-    # Функция для создания базы данных и таблиц
-    def init_db():
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS clients (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL UNIQUE,
-                    password TEXT NOT NULL,
-                    phone TEXT NOT NULL UNIQUE
-                )
-            ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    service TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES clients (id)
-                )
-            ''')
-            conn.commit()
-
-    # Инициализация базы данных при запуске приложения
-    init_db()
-
-    # Функция для отправки сообщения в Telegram
-    def send_to_telegram(chat_id, message):
-        url = f'https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage'
-        payload = {
-            'chat_id': chat_id,
-            'text': message,
-            'parse_mode': 'HTML'
-        }
-        try:
-            response = requests.post(url, json=payload, timeout=5)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ошибка при отправке сообщения в Telegram: {e}")
-            return None
+    # Схема БД (общая для сайта и бота) создаётся и обновляется миграциями — при первом
+    # запросе, а не в create_app(): холодный старт не ждёт SQLite. Дальше это проверка множества
+    @app.before_request
+    def ensure_schema():
+        migrations.migrate()
+        # Уведомления администратору доставляются фоновым диспетчером из таблицы outbox;
+        # он тоже запускается первым запросом, после миграций (повторный вызов ничего не делает)
+        outbox.dispatcher.start(TELEGRAM_BOT_TOKEN)
 
     # Модель пользователя
     class User(UserMixin):
@@ -101,51 +128,60 @@ def create_app():
     # Загрузка пользователя для Flask-Login
     @login_manager.user_loader
     def load_user(user_id):
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, username, phone FROM clients WHERE id = ?', (user_id,))
-            user_data = cursor.fetchone()
+        user_data = repository.get_client_by_id(user_id)
 
         if user_data:
             logger.debug(f"Загружен пользователь: {user_data}")
             return User(id=user_data[0], username=user_data[1], phone=user_data[2])
         return None
 
-    # Хэширование пароля
+    # Хэширование пароля (scrypt в пуле потоков)
     def hash_password(password):
-        return hashlib.sha256(password.encode()).hexdigest()
+        return passwords.hasher.hash(password)
 
     # Регистрация нового пользователя
     def register_user(username, password, phone):
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT id FROM clients WHERE username = ? OR phone = ?', (username, phone))
-            if cursor.fetchone():
-                return False
-
-            hashed_password = hash_password(password)
-            cursor.execute('INSERT INTO clients (username, password, phone) VALUES (?, ?, ?)',
-                           (username, hashed_password, phone))
-            conn.commit()
-        return True
+        hashed_password = hash_password(password)
+        return repository.create_client(username, hashed_password, phone) is not None
 
     # Авторизация пользователя
     def authenticate_user(username, password):
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, username, password, phone FROM clients WHERE username = ?', (username,))
-            user_data = cursor.fetchone()
+        user_data = repository.get_client_by_username(username)
+        if not user_data:
+            return None
 
-        if user_data and user_data[2] == hash_password(password):
-            return User(id=user_data[0], username=user_data[1], phone=user_data[3])
-        return None
+        valid, new_hash = passwords.hasher.verify(password, user_data[2])
+        if not valid:
+            return None
+        if new_hash:
+            # Старый SHA-256 или устаревшая стоимость — сохраняем хэш в текущем формате
+            repository.update_client_password(user_data[0], new_hash)
+            logger.info(f"Пароль пользователя {username} перехэширован")
+        return User(id=user_data[0], username=user_data[1], phone=user_data[3])
+
+    # Ограничение частоты POST-запросов с одного IP (лимиты в ratelimit.py); GET не ограничивается
+    def rate_limited(name):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method == 'POST':
+                    wait = ratelimit.hit(name, request.remote_addr)
+                    if wait:
+                        logger.warning(f"Превышен лимит {name} для {request.remote_addr}")
+                        return Response('Слишком много запросов. Попробуйте позже.', 429,
+                                        {'Retry-After': str(int(wait) + 1)}, mimetype='text/plain')
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
 
     # Маршруты
     @app.route('/')
+    @page_cache.cached('index.html')
     def home():
         return render_template('index.html')
 
     @app.route('/register', methods=['GET', 'POST'])
+    @rate_limited('register')
     def register():
         if request.method == 'POST':
             username = request.form.get('username')
@@ -161,6 +197,7 @@ def create_app():
         return render_template('register.html')
 
     @app.route('/login', methods=['GET', 'POST'])
+    @rate_limited('login')
     def login():
         if request.method == 'POST':
             username = request.form.get('username')
@@ -182,86 +219,284 @@ def create_app():
     @login_required
     def logout():
         logout_user()
+        session.pop('is_admin', None)
         flash('Вы успешно вышли из системы.', 'success')
         return redirect(url_for('home'))
 
     @app.route('/oil-change')
+    @page_cache.cached('oil_change.html')
     def oil_change():
         return render_template('oil_change.html')
 
     @app.route('/chain-adjustment')
+    @page_cache.cached('chain_adjustment.html')
     def chain_adjustment():
         return render_template('chain_adjustment.html')
 
     @app.route('/engine-repair')
+    @page_cache.cached('engine_repair.html')
     def engine_repair():
         return render_template('engine_repair.html')
 
     @app.route('/road-assistance')
+    @page_cache.cached('road_assistance.html')
     def road_assistance():
         return render_template('road_assistance.html')
 
     @app.route('/order', methods=['POST'])
+    @rate_limited('order')
     @login_required
     def order():
         service = request.form.get('service')
-        order_id = save_order_to_db(service)
 
-        message = (
-            f"<b>Новый заказ!</b>\n\n"
-            f"<b>ID заказа:</b> {order_id}\n"
-            f"<b>Услуга:</b> {service}\n"
-            f"<b>Имя:</b> {current_user.username}\n"
-            f"<b>Телефон:</b> {current_user.phone}\n"
+        # Заказ и уведомление о нём записываются одной транзакцией; при всплеске
+        # нагрузки order_writer объединяет одновременные заказы в общий COMMIT
+        order_id = repository.order_writer.write(
+            place_order, current_user.id, current_user.username, current_user.phone, service
         )
 
-        send_to_telegram(TELEGRAM_CHAT_ID, message)
+        metrics.orders_created.inc(service, 'web')
         logger.debug(f"Создан новый заказ: ID={order_id}, Услуга={service}, Пользователь={current_user.username}")
 
         return redirect(url_for('thank_you'))
 
-    def save_order_to_db(service):
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO orders (user_id, service) VALUES (?, ?)',
-                           (current_user.id, service))
-            conn.commit()
-            return cursor.lastrowid
-
-    def get_all_orders():
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT orders.id, clients.username, clients.phone, orders.service,
-                       DATETIME(orders.timestamp, 'localtime') AS local_timestamp
-                FROM orders
-                JOIN clients ON orders.user_id = clients.id
-                ORDER BY orders.timestamp DESC
-            ''')
-            return cursor.fetchall()
+    def place_order(user_id, username, phone, service):
+        """Может выполниться в потоке другого запроса (ведущего order_writer), поэтому
+        current_user сюда передаётся значениями"""
+        order_id = repository.save_order(user_id, service)
+        outbox.enqueue(TELEGRAM_CHAT_ID, (
+            f"<b>Новый заказ!</b>\n\n"
+            f"<b>ID заказа:</b> {order_id}\n"
+            f"<b>Услуга:</b> {service}\n"
+            f"<b>Имя:</b> {username}\n"
+            f"<b>Телефон:</b> {phone}\n"
+        ))
+        return order_id
+
+    def parse_cursor(value):
+        """Курсор страницы имеет вид '<timestamp>|<id>'; у заказа без даты — '|<id>'"""
+        if not value:
+            return None
+        timestamp, separator, order_id = value.rpartition('|')
+        if not separator or not order_id.isdigit():
+            return None
+        return timestamp, int(order_id)
 
     @app.route('/thank-you')
+    @page_cache.cached('thank_you.html')
     def thank_you():
         telegram_bot_link = "https://web.telegram.org/k/#@FirstFreeShell_bot"
         return render_template('thank_you.html', telegram_bot_link=telegram_bot_link)
 
+    # Доступ только после ввода пароля администратора на /admin
+    def admin_required(view):
+        @wraps(view)
+        @login_required
+        def wrapper(*args, **kwargs):
+            if not session.get('is_admin'):
+                return redirect(url_for('admin'))
+            return view(*args, **kwargs)
+        return wrapper
+
+    def parse_date_range():
+        """Границы date_from/date_to из query string в UTC; при неверной дате — ValueError"""
+        date_from = request.args.get('date_from', '').strip()
+        date_to = request.args.get('date_to', '').strip()
+        start = to_utc(date_from) if date_from else None
+        end = to_utc(date_to, days=1) if date_to else None
+        return start, end
+
+    def date_range_from_args():
+        """Границы периода для страниц админки; неверные даты отбрасываются с сообщением"""
+        try:
+            return parse_date_range()
+        except ValueError:
+            flash('Неверный формат даты.', 'error')
+            return None, None
+
     @app.route('/admin', methods=['GET', 'POST'])
+    @rate_limited('admin_login')
     @login_required
     def admin():
         if request.method == 'POST':
             password = request.form.get('password')
             if password == ADMIN_PASSWORD:
-                orders = get_all_orders()
-                formatted_orders = []
-                for order in orders:
-                    order_id, username, phone, service, timestamp = order
-                    formatted_time = format_timestamp(timestamp)
-                    formatted_orders.append((order_id, username, phone, service, formatted_time))
-                return render_template('admin.html', orders=formatted_orders)
+                session['is_admin'] = True
             else:
                 flash('Неверный пароль администратора.', 'error')
-                return redirect(url_for('admin'))
-        return render_template('admin_login.html')
+            return redirect(url_for('admin'))
+
+        if not session.get('is_admin'):
+            return render_template('admin_login.html')
+
+        filters = {key: request.args.get(key, '').strip() for key in ('q', 'service', 'date_from', 'date_to')}
+        per_page = request.args.get('per_page', ADMIN_PAGE_SIZE, type=int)
+        per_page = max(1, min(per_page, ADMIN_MAX_PAGE_SIZE))
+
+        start, end = date_range_from_args()
+
+        orders, next_cursor = repository.get_orders_page(
+            per_page,
+            after=parse_cursor(request.args.get('cursor')),
+            service=filters['service'] or None,
+            start=start,
+            end=end,
+            tz_modifier=timezone_modifier(),
+            search=filters['q'] or None
+        )
+        return render_template(
+            'admin.html',
+            orders=orders,
+            filters=filters,
+            active_filters={key: value for key, value in filters.items() if value},
+            per_page=per_page,
+            next_cursor=f'{next_cursor[0]}|{next_cursor[1]}' if next_cursor else None
+        )
+
+    def stats_from_args():
+        """Сводка за выбранный период; по умолчанию — последние ADMIN_STATS_DAYS дней"""
+        start, end = date_range_from_args()
+        if start is None:
+            today = datetime.now(local_timezone()).strftime('%Y-%m-%d')
+            start = to_utc(today, days=1 - ADMIN_STATS_DAYS)
+        if end is None:
+            end = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        days = repository.get_stats(start, end, tz_modifier=timezone_modifier())
+
+        totals = {}
+        for day in days.values():
+            for service, count in day['orders'].items():
+                totals[service] = totals.get(service, 0) + count
+        return {
+            'days': days,
+            'totals': {
+                'orders': sum(totals.values()),
+                'new_clients': sum(day['new_clients'] for day in days.values()),
+                'by_service': dict(sorted(totals.items(), key=lambda item: -item[1])),
+            },
+        }
+
+    @app.route('/admin/stats')
+    @admin_required
+    def admin_stats():
+        filters = {key: request.args.get(key, '').strip() for key in ('date_from', 'date_to')}
+        return render_template('admin_stats.html', stats=stats_from_args(), filters=filters)
+
+    @app.route('/admin/stats.json')
+    @admin_required
+    def admin_stats_json():
+        return jsonify(stats_from_args())
+
+    # Диагностика по запросу: tracemalloc и сэмплирующий профилировщик
+    @app.route('/admin/profiling')
+    @admin_required
+    def admin_profiling():
+        return render_template('admin_profiling.html', memory=profiling.memory_tracer.status(),
+                               max_seconds=profiling.MAX_PROFILE_SECONDS)
+
+    @app.route('/admin/profiling/memory/<action>', methods=['POST'])
+    @admin_required
+    def admin_memory(action):
+        tracer = profiling.memory_tracer
+        try:
+            if action == 'start':
+                tracer.start(request.form.get('frames', 1, type=int))
+            elif action == 'stop':
+                tracer.stop()
+            elif action == 'baseline':
+                tracer.take_baseline()
+            else:
+                return 'Неизвестное действие', 404
+        except RuntimeError as e:
+            flash(str(e), 'error')
+        return redirect(url_for('admin_profiling'))
+
+    @app.route('/admin/profiling/memory/diff')
+    @admin_required
+    def admin_memory_diff():
+        top = max(1, min(request.args.get('top', 20, type=int), 500))
+        key_type = request.args.get('key', 'lineno')
+        if key_type not in ('lineno', 'filename', 'traceback'):
+            return 'Неизвестный ключ группировки', 400
+        try:
+            return jsonify(status=profiling.memory_tracer.status(),
+                           top=profiling.memory_tracer.diff(top, key_type))
+        except RuntimeError as e:
+            return jsonify(error=str(e)), 409
+
+    @app.route('/admin/profiling/cpu')
+    @admin_required
+    def admin_cpu_profile():
+        """Профиль всех потоков (Flask, бот, фоновые) за seconds секунд; запрос ждёт окончания.
+
+        idle=1 оставляет в профиле и ждущие потоки (профиль по реальному времени).
+        """
+        seconds = request.args.get('seconds', 10, type=float)
+        interval = request.args.get('interval_ms', 5, type=float) / 1000
+        profile_format = request.args.get('format', 'collapsed')
+        if profile_format not in ('collapsed', 'pstats'):
+            return 'Неизвестный формат профиля', 400
+        try:
+            stacks, actual_interval = profiling.cpu_profiler.run(
+                seconds, interval, include_idle=request.args.get('idle') == '1'
+            )
+        except RuntimeError as e:
+            return str(e), 409
+
+        if profile_format == 'pstats':
+            response = Response(profiling.pstats_dump(stacks, actual_interval), mimetype='application/octet-stream')
+            filename = 'profile.pstats'
+        else:
+            response = Response(profiling.collapsed(stacks), mimetype='text/plain')
+            filename = 'profile.collapsed.txt'
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
+
+    EXPORT_COLUMNS = ('id', 'username', 'phone', 'service', 'timestamp')
+
+    @app.route('/admin/export')
+    @admin_required
+    def export_orders():
+        export_format = request.args.get('format', 'csv')
+        if export_format not in ('csv', 'ndjson'):
+            return 'Неизвестный формат экспорта', 400
+        # Без фильтра выгрузилась бы вся таблица заказов — неверная дата здесь ошибка
+        try:
+            start, end = parse_date_range()
+        except ValueError:
+            return 'Неверный формат даты', 400
+        rows = repository.iter_orders(start=start, end=end)
+
+        def generate_csv():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            # BOM, чтобы Excel сразу открыл файл в UTF-8
+            buffer.write('\ufeff')
+            writer.writerow(EXPORT_COLUMNS)
+            for count, row in enumerate(rows, 1):
+                writer.writerow(row)
+                if count % 1000 == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
+        def generate_ndjson():
+            lines = []
+            for row in rows:
+                lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+                if len(lines) == 1000:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+            if lines:
+                yield '\n'.join(lines) + '\n'
+
+        if export_format == 'csv':
+            response = Response(generate_csv(), mimetype='text/csv')
+        else:
+            response = Response(generate_ndjson(), mimetype='application/x-ndjson')
+        response.headers['Content-Disposition'] = f'attachment; filename=orders.{export_format}'
+        return response
 
     return app
 
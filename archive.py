@@ -0,0 +1,179 @@
+"""
+Перенос старых заказов в помесячные архивы.
+
+    python archive.py             # один проход: заказы старше ARCHIVE_AFTER_DAYS дней
+    python archive.py --days 90
+
+Заказы переносятся из orders в файлы ARCHIVE_DIR/orders-YYYY-MM.db (таблица orders и свой
+orders_fts), месяц записывается в реестр order_archives. Горячая таблица и её индексы
+остаются маленькими и помещаются в страничный кэш; админка читает архивы через
+repository.order_sources(), только если запрошенный период до них доходит.
+
+Перенос идёт в два шага: копия в архив (INSERT OR IGNORE), затем удаление из orders тех
+заказов, что уже есть в архиве. Если процесс упадёт между ними, следующий проход доделает
+работу; заказ может на время оказаться в обоих местах, но не потеряется.
+Сводки order_stats не меняются: архивные заказы остаются в статистике.
+В архиве имя и телефон клиента в orders_fts — на момент переноса.
+"""
+import os
+import logging
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+import repository
+import migrations
+
+logger = logging.getLogger(__name__)
+
+# Заказы старше стольких дней уходят в архив; 0 — фоновый перенос выключен
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+# Как часто фоновый поток проверяет, есть ли что переносить, секунд
+ARCHIVE_INTERVAL = float(os.getenv('ARCHIVE_INTERVAL', '86400'))
+# Сколько заказов удалять из orders за одну транзакцию: запись сайта и бота не ждёт весь месяц
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '2000'))
+
+SELECT_MONTHS = "SELECT DISTINCT substr(timestamp, 1, 7) FROM orders WHERE timestamp < ? ORDER BY 1"
+CREATE_ARCHIVE_ORDERS = '''
+    CREATE TABLE IF NOT EXISTS {schema}.orders (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        service TEXT NOT NULL,
+        timestamp DATETIME
+    )
+'''
+CREATE_ARCHIVE_INDEX = 'CREATE INDEX IF NOT EXISTS {schema}.idx_orders_timestamp ON orders (timestamp)'
+COPY_ORDERS = '''
+    INSERT OR IGNORE INTO {schema}.orders (id, user_id, service, timestamp)
+    SELECT id, user_id, service, timestamp FROM main.orders
+    WHERE timestamp >= ? AND timestamp < ?
+'''
+COPY_SEARCH_INDEX = '''
+    INSERT INTO {schema}.orders_fts (rowid, username, phone, service)
+    SELECT rowid, username, phone, service FROM main.orders_fts
+    WHERE rowid IN (SELECT id FROM main.orders WHERE timestamp >= ? AND timestamp < ?)
+      AND rowid NOT IN (SELECT rowid FROM {schema}.orders_fts)
+'''
+SELECT_COPIED = '''
+    SELECT id, strftime('%Y-%m-%d %H:00:00', timestamp), service FROM main.orders
+    WHERE timestamp >= ? AND timestamp < ? AND id IN (SELECT id FROM {schema}.orders)
+    LIMIT ?
+'''
+# Триггер order_stats_delete вычитает удалённые заказы из сводок; возвращаем их обратно
+KEEP_STATS = '''
+    INSERT INTO order_stats (hour, service, orders) VALUES (?, ?, ?)
+    ON CONFLICT (hour, service) DO UPDATE SET orders = orders + excluded.orders
+'''
+DELETE_ORDER = 'DELETE FROM main.orders WHERE id = ?'
+REGISTER_MONTH = '''
+    INSERT INTO order_archives (month, orders) VALUES (?, (SELECT COUNT(*) FROM {schema}.orders))
+    ON CONFLICT (month) DO UPDATE SET orders = excluded.orders, archived_at = CURRENT_TIMESTAMP
+'''
+
+
+def next_month(month: str) -> str:
+    year, number = map(int, month.split('-'))
+    return f'{year + number // 12}-{number % 12 + 1:02d}'
+
+
+def archive_month(month: str, cutoff: str, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Переносит заказы месяца month, созданные раньше cutoff; возвращает число перенесённых"""
+    start = f'{month}-01 00:00:00'
+    end = min(cutoff, f'{next_month(month)}-01 00:00:00')
+    schema = repository.archive_alias(month)
+
+    os.makedirs(repository.ARCHIVE_DIR, exist_ok=True)
+    repository.db.attach(repository.archive_path(month), schema)
+
+    # Копия пишет только в файл архива: DEFERRED не блокирует запись в основную базу
+    with repository.db.transaction('DEFERRED') as cursor:
+        cursor.execute(CREATE_ARCHIVE_ORDERS.format(schema=schema))
+        cursor.execute(CREATE_ARCHIVE_INDEX.format(schema=schema))
+        migrations.create_fts_table(cursor, schema)
+        cursor.execute(COPY_ORDERS.format(schema=schema), (start, end))
+        cursor.execute(COPY_SEARCH_INDEX.format(schema=schema), (start, end))
+
+    moved = 0
+    while True:
+        with repository.db.transaction() as cursor:
+            rows = cursor.execute(SELECT_COPIED.format(schema=schema), (start, end, batch_size)).fetchall()
+            if not rows:
+                break
+            stats = Counter((hour, service) for _, hour, service in rows if hour)
+            cursor.executemany(KEEP_STATS, [(hour, service, count) for (hour, service), count in stats.items()])
+            cursor.executemany(DELETE_ORDER, [(row[0],) for row in rows])
+            cursor.execute(REGISTER_MONTH.format(schema=schema), (month,))
+        moved += len(rows)
+
+    if moved:
+        repository.db.execute(f"INSERT INTO {schema}.orders_fts (orders_fts) VALUES ('optimize')")
+        logger.info(f"В архив {month} перенесено заказов: {moved}")
+    return moved
+
+
+def archive_orders(days: int = ARCHIVE_AFTER_DAYS) -> dict:
+    """Переносит в архив заказы старше days дней; возвращает {месяц: перенесено}"""
+    migrations.migrate()
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    months = [row[0] for row in repository.db.fetchall(SELECT_MONTHS, (cutoff,))]
+    return {month: archive_month(month, cutoff) for month in months}
+
+
+class OrderArchiver:
+    """Фоновый поток, который раз в interval секунд переносит в архив заказы старше days дней.
+
+    Запускается в одном процессе (server.py, main.py); одновременные проходы из разных
+    процессов безопасны, но бесполезны.
+    """
+
+    def __init__(self, days: int = ARCHIVE_AFTER_DAYS, interval: float = ARCHIVE_INTERVAL,
+                 first_delay: float = 60.0):
+        self.days = days
+        self.interval = interval
+        self.first_delay = first_delay
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.days <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='order-archiver', daemon=True)
+        self._thread.start()
+        logger.info(f"Архивация заказов старше {self.days} дн. включена")
+
+    def stop(self, timeout: float = None):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        # Первый проход откладывается, чтобы не мешать холодному старту
+        delay = self.first_delay
+        while not self._stopped.wait(delay):
+            try:
+                archive_orders(self.days)
+            except Exception as e:
+                logger.error(f"Ошибка архивации заказов: {e}", exc_info=True)
+            delay = self.interval
+
+
+archiver = OrderArchiver()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='архивировать заказы старше N дней')
+    args = parser.parse_args()
+    if args.days <= 0:
+        parser.error('--days должно быть больше 0')
+    moved = archive_orders(args.days)
+    logger.info(f"Перенесено заказов: {sum(moved.values())} за месяцы {', '.join(moved) or '—'}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    main()
@@ -0,0 +1,160 @@
+import os
+import json
+import logging
+import mimetypes
+from flask import abort, request, send_file, url_for
+from markupsafe import Markup, escape
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+# Манифесты, которые пишет build_assets.py (пути относительно static/)
+IMAGE_MANIFEST = 'build/images.json'
+STATIC_MANIFEST = 'build/static.json'
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+# Всё в static/build/ содержит хэш содержимого в имени и никогда не меняется
+FINGERPRINTED_PREFIX = 'build/'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Предсжатые копии в порядке предпочтения
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+class ImageManifest:
+    """Адаптивные варианты изображений из манифеста; без сборки отдаёт исходные файлы"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.images = {}
+        self._mtime = None
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self.images, self._mtime = {}, None
+            return
+        if mtime != self._mtime:
+            with open(self.path, encoding='utf-8') as f:
+                self.images = json.load(f)
+            self._mtime = mtime
+            logger.info(f"Загружен манифест изображений: {len(self.images)} файлов")
+
+    def srcset(self, filename: str, fmt: str = None) -> str:
+        """Строка для атрибута srcset; fmt по умолчанию — запасной формат (JPEG/PNG)"""
+        entry = self.images.get(filename)
+        if not entry:
+            return ''
+        variants = entry['variants'].get(fmt or entry['fallback'], [])
+        return ', '.join(f"{url_for('static', filename=v['path'])} {v['width']}w" for v in variants)
+
+    def src(self, filename: str) -> str:
+        """URL самой большой версии в запасном формате (или исходного файла)"""
+        entry = self.images.get(filename)
+        if not entry:
+            return url_for('static', filename=filename)
+        return url_for('static', filename=entry['variants'][entry['fallback']][-1]['path'])
+
+    def picture(self, filename: str, alt: str, sizes: str = '100vw', **attrs) -> Markup:
+        """<picture> с AVIF/WebP-источниками и <img> с srcset в запасном формате"""
+        extra = ''.join(f' {escape(name)}="{escape(value)}"' for name, value in attrs.items())
+        entry = self.images.get(filename)
+        if not entry:
+            return Markup(f'<img src="{escape(self.src(filename))}" alt="{escape(alt)}"{extra}>')
+
+        sources = ''.join(
+            f'<source type="{MIME_TYPES[fmt]}" srcset="{escape(self.srcset(filename, fmt))}" sizes="{escape(sizes)}">'
+            for fmt in ('avif', 'webp') if fmt in entry['variants']
+        )
+        img = (
+            f'<img src="{escape(self.src(filename))}" srcset="{escape(self.srcset(filename))}" '
+            f'sizes="{escape(sizes)}" width="{entry["width"]}" height="{entry["height"]}" '
+            f'alt="{escape(alt)}"{extra}>'
+        )
+        return Markup(f'<picture>{sources}{img}</picture>')
+
+    def background(self, filename: str, selector: str = 'body') -> Markup:
+        """Инлайн-стиль фона: по медиазапросу на каждую ширину, WebP/AVIF через image-set()"""
+        entry = self.images.get(filename)
+        if not entry:
+            return Markup('')
+
+        def image_set(index):
+            urls = []
+            for fmt in ('avif', 'webp', entry['fallback']):
+                if fmt in entry['variants']:
+                    url = url_for('static', filename=entry['variants'][fmt][index]['path'])
+                    mime = MIME_TYPES.get(fmt, f'image/{fmt}')
+                    urls.append(f'url("{url}") type("{mime}")')
+            return f'image-set({", ".join(urls)})'
+
+        widths = [v['width'] for v in entry['variants'][entry['fallback']]]
+        rules = [f'{selector} {{ background-image: {image_set(-1)}; }}']
+        # От большей ширины к меньшей, чтобы более узкий медиазапрос шёл последним и побеждал
+        for index in range(len(widths) - 2, -1, -1):
+            rules.append(f'@media (max-width: {widths[index]}px) {{ {selector} {{ background-image: {image_set(index)}; }} }}')
+        return Markup('<style>' + '\n'.join(rules) + '</style>')
+
+
+def load_static_manifest(path: str) -> dict:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def serve_fingerprinted(static_folder: str, filename: str):
+    """Отдаёт файл из static/build/: предсжатая копия по Accept-Encoding, immutable и строгий ETag"""
+    path = safe_join(static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    encoding = None
+    for name, suffix in PRECOMPRESSED:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            encoding, path = name, path + suffix
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_file(path, mimetype=mimetype, conditional=False, etag=False)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    # Хэш содержимого уже в имени файла; кодировка различает сжатые представления
+    response.set_etag(f'{os.path.basename(filename)}-{encoding or "identity"}')
+    return response.make_conditional(request)
+
+
+def init_app(app):
+    """Подключает манифесты build_assets.py: помощники для изображений и отпечатки url_for('static')"""
+    manifest = ImageManifest(os.path.join(app.static_folder, IMAGE_MANIFEST))
+    manifest.load()
+
+    fingerprints = load_static_manifest(os.path.join(app.static_folder, STATIC_MANIFEST))
+    if fingerprints:
+        logger.info(f"Загружен манифест статики: {len(fingerprints)} файлов")
+
+    @app.url_defaults
+    def fingerprint_static_url(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = fingerprints.get(values['filename'], values['filename'])
+
+    default_static_view = app.view_functions['static']
+
+    def static(filename):
+        if filename.startswith(FINGERPRINTED_PREFIX):
+            return serve_fingerprinted(app.static_folder, filename)
+        return default_static_view(filename=filename)
+
+    app.view_functions['static'] = static
+
+    app.jinja_env.globals.update(
+        picture=manifest.picture,
+        srcset=manifest.srcset,
+        image_src=manifest.src,
+        responsive_background=manifest.background,
+    )
+    app.extensions['image_manifest'] = manifest
+    return manifest
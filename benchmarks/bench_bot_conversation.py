@@ -0,0 +1,262 @@
+"""
+Пропускная способность диалога бота (/start → услуга → имя → телефон → пароль)
+на синтетических обновлениях.
+
+Генерирует по пять обновлений на каждый из --chats диалогов и перемешивает их. Одновременно
+открыто не больше --active диалогов, а порядок шагов внутри чата сохраняется. Обновления
+проходят через Application с шардированным процессором так же, как в продакшене:
+- --mode polling: telegram_bot.run_polling, обновления отдаёт getUpdates, забирает Updater;
+- --mode webhook: BotManager.run_webhook, JSON-тела уходят в submit_update из другого
+  потока, как из Flask.
+Запросы бота к Bot API заглушены (StubRequest), база временная, уведомления outbox уходят
+на локальный FakeTelegram.
+
+Результат — JSON: завершённые заказы в секунду, время каждого обработчика (p50/p95/p99),
+размер context.user_data после прогона и, с --tracemalloc, прирост памяти процесса.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_bot_conversation --mode webhook --chats 2000 --active 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+
+from benchmarks.fake_telegram import BotApi, FakeTelegram, StubRequest
+from benchmarks.stats import percentile
+
+STEPS = ('start', 'choose_service', 'enter_name', 'enter_phone', 'enter_password')
+FIRST_CHAT_ID = 10 ** 6
+WEBHOOK_SECRET = 'bench-secret'
+
+
+def configure_environment(args, fake_url):
+    tmpdir = tempfile.mkdtemp(prefix='bench_bot_conversation_')
+    os.environ.update({
+        'DATABASE_PATH': os.path.join(tmpdir, 'orders.db'),
+        'TELEGRAM_API_URL': fake_url,
+        'TELEGRAM_BOT_TOKEN': '123456:bench',
+        'TELEGRAM_CHAT_ID': '1',
+        'PASSWORD_HASH_COST': str(args.hash_cost),
+        'RATE_LIMIT_ENABLED': 'false',
+    })
+    os.environ.pop('WEBHOOK_PORT', None)
+
+
+def message_update(chat_id, text):
+    message = {
+        'message_id': 0,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': f'User {chat_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return {'message': message}
+
+
+def generate_updates(chats, active, services, seed=42):
+    """Обновления всех диалогов: окнами по active чатов, шаги внутри окна перемешаны"""
+    rng = random.Random(seed)
+    dialogs = []
+    for n in range(chats):
+        chat_id = FIRST_CHAT_ID + n
+        texts = ('/start', rng.choice(services), f'Клиент {n}', f'+7900{n:07d}', f'password-{n}')
+        dialogs.append(deque(message_update(chat_id, text) for text in texts))
+
+    updates = []
+    for offset in range(0, chats, active):
+        window = dialogs[offset:offset + active]
+        while window:
+            index = rng.randrange(len(window))
+            updates.append(window[index].popleft())
+            if not window[index]:
+                window[index] = window[-1]
+                window.pop()
+    for update_id, update in enumerate(updates, 1):
+        update['update_id'] = update_id
+        update['message']['message_id'] = update_id
+    return updates
+
+
+def instrument(manager, latencies, finished):
+    """Оборачивает обработчики шагов до регистрации: время каждого вызова и счёт завершённых диалогов"""
+    for step in STEPS:
+        handler = getattr(manager, step)
+
+        async def timed(update, context, handler=handler, step=step):
+            started = time.perf_counter()
+            try:
+                return await handler(update, context)
+            finally:
+                latencies[step].append(time.perf_counter() - started)
+                if step == 'enter_password':
+                    finished.append(update.effective_chat.id)
+
+        setattr(manager, step, timed)
+
+
+def stub_network(manager, api, delay):
+    builder = manager._builder
+
+    def stubbed():
+        return builder() \
+            .request(StubRequest(api, delay)) \
+            .get_updates_request(StubRequest(api, delay))
+
+    manager._builder = stubbed
+
+
+def deep_size(value, seen=None) -> int:
+    """Приблизительный размер объекта вместе с содержимым словарей и списков"""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_size(item, seen) for item in value)
+    return size
+
+
+def wait_for(condition, timeout, what):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Не дождались: {what() if callable(what) else what}")
+        time.sleep(0.005)
+
+
+def feed_webhook(manager, updates):
+    """Как Flask-обработчик /webhook: 429 означает полную очередь, повторяем позже"""
+    rejected = 0
+    for update in updates:
+        body = json.dumps(update).encode()
+        while True:
+            status = manager.submit_update(body)
+            if status == 200:
+                break
+            if status != 429:
+                raise RuntimeError(f"submit_update вернул {status}")
+            rejected += 1
+            time.sleep(0.001)
+    return rejected
+
+
+def summarize(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'p50_ms': round(statistics.median(ordered) * 1000, 2),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def run(args) -> dict:
+    fake = FakeTelegram().start()
+    configure_environment(args, fake.url)
+    import repository
+    import passwords
+    import telegram_bot
+    manager = telegram_bot.bot_manager
+
+    api = BotApi()
+    latencies = defaultdict(list)
+    finished = []
+    stub_network(manager, api, args.api_delay_ms / 1000)
+    instrument(manager, latencies, finished)
+    updates = generate_updates(args.chats, max(args.active, 1), list(telegram_bot.SERVICES))
+
+    if args.mode == 'polling':
+        target = telegram_bot.run_polling
+    else:
+        target = lambda: manager.run_webhook('localhost', 0, WEBHOOK_SECRET)  # noqa: E731
+    threading.Thread(target=target, name='bot', daemon=True).start()
+    wait_for(lambda: manager.application and manager.application.running, 30, "запуск бота")
+    if args.mode == 'polling':
+        wait_for(lambda: manager.application.updater.running, 30, "запуск Updater")
+    # Пул хэширования стартует лениво: первый диалог не должен платить за запуск процессов
+    passwords.hasher.hash('warmup')
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    rejected = 0
+    if args.mode == 'polling':
+        api.push_updates(updates)
+    else:
+        rejected = feed_webhook(manager, updates)
+    wait_for(lambda: len(finished) >= args.chats, args.timeout,
+             lambda: f"завершение диалогов ({len(finished)} из {args.chats})")
+    elapsed = time.perf_counter() - started
+    memory_growth = tracemalloc.get_traced_memory()[0] - memory_before
+    tracemalloc.stop()
+
+    orders = repository.db.fetchone("SELECT COUNT(*) FROM orders")[0]
+    user_data = manager.application.user_data
+    user_data_bytes = deep_size(dict(user_data))
+    return {
+        'mode': args.mode,
+        'chats': args.chats,
+        'active': args.active,
+        'updates': len(updates),
+        'api_delay_ms': args.api_delay_ms,
+        'hash_cost': args.hash_cost,
+        'elapsed_s': round(elapsed, 2),
+        'orders': orders,
+        'orders_per_sec': round(orders / elapsed, 1),
+        'updates_per_sec': round(len(updates) / elapsed, 1),
+        'webhook_429': rejected,
+        'steps': {step: summarize(latencies[step]) for step in STEPS},
+        'bot_api_calls': dict(api.calls),
+        'user_data': {
+            'entries': len(user_data),
+            'non_empty': sum(1 for data in user_data.values() if data),
+            'bytes': user_data_bytes,
+            'bytes_per_chat': round(user_data_bytes / max(args.chats, 1), 1),
+        },
+        'traced_memory_growth_bytes': memory_growth if args.tracemalloc else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default='webhook')
+    parser.add_argument('--chats', type=int, default=2000)
+    parser.add_argument('--active', type=int, default=200, help='одновременно открытых диалогов')
+    parser.add_argument('--api-delay-ms', type=float, default=0, help='задержка каждого запроса к Bot API')
+    parser.add_argument('--hash-cost', type=int, default=10, help='PASSWORD_HASH_COST для прогона')
+    parser.add_argument('--tracemalloc', action='store_true', help='измерять прирост памяти (медленнее)')
+    parser.add_argument('--timeout', type=float, default=600)
+    args = parser.parse_args()
+
+    code = 0
+    try:
+        print(json.dumps(run(args), ensure_ascii=False, indent=2))
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        code = 1
+    sys.stdout.flush()
+    import passwords
+    passwords.hasher.shutdown()
+    # Цикл бота крутится в потоке-демоне без штатной остановки
+    os._exit(code)
+
+
+if __name__ == '__main__':
+    main()
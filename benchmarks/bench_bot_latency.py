@@ -0,0 +1,150 @@
+"""
+Проверка, что обработчики диалога бота не блокируют цикл событий.
+
+Прогоняет полный диалог (/start → услуга → имя → телефон → пароль) для нескольких
+одновременных чатов на временной базе и для каждого шага измеряет самый долгий
+синхронный участок между await — ровно то время, на которое шаг останавливает все
+остальные диалоги. Если хоть один шаг превысил бюджет, скрипт завершается с кодом 1.
+Сеть Telegram не используется: ответы обработчиков заглушены, outbox только пишет в БД.
+--io-delay-ms добавляет задержку к каждой транзакции и имитирует медленный диск.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_bot_latency --chats 50 --budget-ms 20 --io-delay-ms 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from benchmarks.stats import percentile
+
+STEPS = ('start', 'choose_service', 'enter_name', 'enter_phone', 'enter_password')
+
+
+class Timed:
+    """Awaitable-обёртка над корутиной: запоминает самый долгий шаг coro.send()"""
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.max_block = 0.0
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            started = time.perf_counter()
+            try:
+                if error is not None:
+                    yielded = self.coro.throw(error)
+                else:
+                    yielded = self.coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.max_block = max(self.max_block, time.perf_counter() - started)
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def delete(self):
+        pass
+
+
+async def run_chat(manager, chat_id, service, results):
+    context = SimpleNamespace(user_data={})
+    texts = ('/start', service, f'Клиент {chat_id}', f'+7900{chat_id:07d}', 'secret-password')
+    for step, text in zip(STEPS, texts):
+        message = FakeMessage(text)
+        timed = Timed(getattr(manager, step)(SimpleNamespace(message=message), context))
+        await timed
+        results[step].append(timed.max_block)
+    return message.replies[-1]
+
+
+def slow_down_transactions(delay):
+    """Имитирует медленный диск: каждая внешняя транзакция дольше на delay секунд"""
+    import repository
+
+    transaction = repository.db.transaction
+
+    @contextmanager
+    def slow_transaction():
+        outer = not getattr(repository.db._local, 'depth', 0)
+        with transaction() as cursor:
+            yield cursor
+            if outer:
+                time.sleep(delay)
+
+    repository.db.transaction = slow_transaction
+
+
+async def run(chats):
+    from telegram_bot import bot_manager, SERVICES
+
+    services = list(SERVICES)
+    results = {step: [] for step in STEPS}
+    started = time.perf_counter()
+    replies = await asyncio.gather(*(
+        run_chat(bot_manager, chat_id, services[chat_id % len(services)], results)
+        for chat_id in range(chats)
+    ))
+    elapsed = time.perf_counter() - started
+    failed = [reply for reply in replies if not reply.startswith('✅')]
+    return results, elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=50, help='одновременных диалогов')
+    parser.add_argument('--budget-ms', type=float, default=20.0, help='допустимая блокировка цикла одним шагом')
+    parser.add_argument('--io-delay-ms', type=float, default=0.0, help='искусственная задержка каждой транзакции')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_bot_latency_')
+    os.environ['DATABASE_PATH'] = os.path.join(tmpdir, 'orders.db')
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '123456:bench')
+    os.environ.setdefault('TELEGRAM_CHAT_ID', '1')
+
+    if args.io_delay_ms:
+        slow_down_transactions(args.io_delay_ms / 1000)
+    results, elapsed, failed = asyncio.run(run(args.chats))
+
+    report = {
+        'chats': args.chats,
+        'budget_ms': args.budget_ms,
+        'elapsed_s': round(elapsed, 3),
+        'failed_orders': len(failed),
+        'block_ms': {
+            step: {
+                'p50': round(statistics.median(values) * 1000, 3),
+                'p99': round(percentile(values, 0.99) * 1000, 3),
+                'max': round(max(values) * 1000, 3),
+            }
+            for step, values in results.items()
+        },
+    }
+    over_budget = [step for step, value in report['block_ms'].items() if value['max'] > args.budget_ms]
+    report['over_budget'] = over_budget
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if over_budget or failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
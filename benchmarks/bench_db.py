@@ -0,0 +1,113 @@
+"""
+Сравнение слоя repository.py со старым подходом "новое соединение на каждый вызов".
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_db --ops 5000 --threads 4
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import repository
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS clients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        phone TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        service TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES clients (id)
+    );
+'''
+
+CLIENTS = 1000
+
+
+def prepare(path):
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA)
+        conn.executemany(
+            'INSERT INTO clients (username, password, phone) VALUES (?, ?, ?)',
+            [(f'user{i}', 'x' * 64, f'+7900{i:07d}') for i in range(CLIENTS)]
+        )
+
+
+class Legacy:
+    """Копия прежних функций app.py: sqlite3.connect на каждый вызов"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load_user(self, user_id):
+        with sqlite3.connect(self.path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(repository.SELECT_CLIENT_BY_ID, (user_id,))
+            return cursor.fetchone()
+
+    def save_order(self, user_id, service):
+        with sqlite3.connect(self.path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(repository.INSERT_ORDER, (user_id, service))
+            conn.commit()
+            return cursor.lastrowid
+
+
+class Pooled:
+    def __init__(self, path):
+        self.db = repository.Repository(path)
+
+    def load_user(self, user_id):
+        return self.db.fetchone(repository.SELECT_CLIENT_BY_ID, (user_id,))
+
+    def save_order(self, user_id, service):
+        with self.db.transaction() as cursor:
+            cursor.execute(repository.INSERT_ORDER, (user_id, service))
+            return cursor.lastrowid
+
+
+def run(impl, ops, threads, write_ratio):
+    write_every = max(1, round(1 / write_ratio)) if write_ratio else 0
+
+    def op(i):
+        if write_every and i % write_every == 0:
+            impl.save_order(i % CLIENTS + 1, 'Замена масла')
+        else:
+            impl.load_user(i % CLIENTS + 1)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(op, range(ops)))
+    elapsed = time.perf_counter() - started
+    return {'ops': ops, 'seconds': round(elapsed, 3), 'ops_per_sec': round(ops / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ops', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='доля операций записи')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in (('legacy', Legacy), ('repository', Pooled)):
+            path = os.path.join(tmp, f'{name}.db')
+            prepare(path)
+            results[name] = run(factory(path), args.ops, args.threads, args.write_ratio)
+
+    results['speedup'] = round(results['repository']['ops_per_sec'] / results['legacy']['ops_per_sec'], 2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
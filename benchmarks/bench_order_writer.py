@@ -0,0 +1,105 @@
+"""
+Заказов в секунду: отдельная транзакция на каждый заказ против групповой фиксации
+repository.GroupCommitWriter. Каждый заказ, как и в приложении, — строка orders плюс
+строка outbox.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_order_writer --orders 5000 --threads 32 --synchronous FULL
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import outbox
+import repository
+from benchmarks.bench_db import CLIENTS, prepare
+from benchmarks.stats import percentile
+
+
+def place_order(repo, user_id):
+    """Транзакцию открывает вызывающий: отдельную на заказ или общую на пачку, как /order"""
+    order_id = repo.execute(repository.INSERT_ORDER, (user_id, 'Замена масла')).lastrowid
+    repo.execute(outbox.INSERT_MESSAGE, ('1', f'Новый заказ #{order_id}'))
+    return order_id
+
+
+def place_order_per_call(repo, user_id):
+    with repo.transaction():
+        return place_order(repo, user_id)
+
+
+def run(path, orders, threads, writer_factory=None):
+    repo = repository.Repository(path)
+    writer = writer_factory(repo) if writer_factory else None
+    errors = []
+
+    def order(i):
+        started = time.perf_counter()
+        try:
+            if writer:
+                order_id = writer.write(place_order, repo, i % CLIENTS + 1)
+            else:
+                order_id = place_order_per_call(repo, i % CLIENTS + 1)
+            assert order_id
+        except Exception as e:
+            errors.append(str(e))
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(order, range(orders)))
+    elapsed = time.perf_counter() - started
+
+    stored = repo.fetchone('SELECT COUNT(*) FROM orders')[0]
+    repo.close_all()
+    result = {
+        'orders_per_sec': round(orders / elapsed, 1),
+        'latency_ms': {
+            'p50': round(statistics.median(latencies) * 1000, 2),
+            'p99': round(percentile(latencies, 0.99) * 1000, 2),
+        },
+        'stored': stored,
+        'errors': len(errors),
+    }
+    if writer:
+        result['writer'] = writer.stats()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32, help='одновременных запросов')
+    parser.add_argument('--batch', type=int, default=repository.ORDER_BATCH_SIZE, help='ORDER_BATCH_SIZE')
+    parser.add_argument('--synchronous', default='NORMAL', choices=('OFF', 'NORMAL', 'FULL'),
+                        help='PRAGMA synchronous: FULL делает fsync на каждый COMMIT')
+    args = parser.parse_args()
+
+    repository.PRAGMAS = tuple(
+        (name, args.synchronous if name == 'synchronous' else value) for name, value in repository.PRAGMAS
+    )
+
+    def group_commit(repo):
+        return repository.GroupCommitWriter(repo, max_batch=args.batch)
+
+    results = {'threads': args.threads, 'synchronous': args.synchronous}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in (('per_call', None), ('group_commit', group_commit)):
+            path = os.path.join(tmp, f'{name}.db')
+            prepare(path)
+            with repository.Repository(path).transaction() as cursor:
+                cursor.execute(outbox.CREATE_OUTBOX)
+            results[name] = run(path, args.orders, args.threads, factory)
+
+    results['speedup'] = round(
+        results['group_commit']['orders_per_sec'] / results['per_call']['orders_per_sec'], 2
+    )
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
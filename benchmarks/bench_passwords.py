@@ -0,0 +1,67 @@
+"""
+Пропускная способность входа (проверка пароля) для разных значений PASSWORD_HASH_COST.
+
+Помогает выбрать стоимость scrypt по данным: задержка одного входа и входов в секунду
+при заданном числе одновременных запросов.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_passwords --costs 12 13 14 15 --logins 200 --concurrency 8
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import passwords
+from benchmarks.stats import percentile
+
+
+def bench_cost(cost, logins, concurrency, workers):
+    hasher = passwords.PasswordHasher(cost=cost, workers=workers)
+    stored = hasher.hash('correct horse battery staple')
+
+    def login(_):
+        started = time.perf_counter()
+        valid, _new_hash = hasher.verify('correct horse battery staple', stored)
+        assert valid
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+
+    return {
+        'cost': cost,
+        'memory_per_hash_mb': round(128 * passwords.PASSWORD_HASH_R * 2 ** cost / 2 ** 20, 1),
+        'logins_per_sec': round(logins / elapsed, 1),
+        'latency_ms': {
+            'p50': round(statistics.median(latencies) * 1000, 1),
+            'p95': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99': round(percentile(latencies, 0.99) * 1000, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--costs', type=int, nargs='+', default=[12, 13, 14, 15])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8, help='одновременных входов')
+    parser.add_argument('--workers', type=int, default=passwords.PASSWORD_HASH_WORKERS, help='потоков в пуле')
+    args = parser.parse_args()
+
+    results = {
+        'workers': args.workers,
+        'cpu_count': os.cpu_count(),
+        'concurrency': args.concurrency,
+        'runs': [bench_cost(cost, args.logins, args.concurrency, args.workers) for cost in args.costs],
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Сравнение пропускной способности: main.py (Werkzeug и бот в одном процессе) против
+server.py (один процесс бота и пре-форкнутые воркеры gunicorn).
+
+Каждый режим запускается отдельным процессом на свободном порту, со своей временной базой и
+ботом в режиме webhook, направленным на локальный FakeTelegram. Затем по нему гоняются фазы
+из load_test: /register, /login, /order, /admin и /webhook. Результат — JSON с p50/p95/p99 и
+пропускной способностью по фазам для обоих режимов.
+
+Выигрыш server.py растёт с числом ядер: на одном ядре воркеры делят один процессор.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_prefork --workers 4 --users 200 --concurrency 32
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.load_test import configure_environment, run_phases
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = {
+    'main': [sys.executable, 'main.py'],
+    'server': [sys.executable, 'server.py'],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def launch(mode, args, log_path):
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), IS_RENDER='true', RENDER_EXTERNAL_HOSTNAME='localhost',
+               WEB_CONCURRENCY=str(args.workers))
+    if mode == 'server':
+        env['WEBHOOK_PORT'] = str(free_port())
+    else:
+        env.pop('WEBHOOK_PORT', None)
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(COMMANDS[mode], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, f'http://127.0.0.1:{port}'
+
+
+def wait_ready(process, base, fake, timeout=60):
+    """Сайт отвечает на /healthcheck, а бот уже зарегистрировал вебхук"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Процесс завершился с кодом {process.returncode}")
+        try:
+            if requests.get(f'{base}/healthcheck', timeout=1).ok and fake.calls['setWebhook']:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Сервер не поднялся")
+
+
+def stop(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(40)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='main,server')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='WEB_CONCURRENCY для server.py')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--orders', type=int, default=5)
+    parser.add_argument('--admin-views', type=int, default=2)
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--telegram-delay-ms', type=float, default=50)
+    parser.add_argument('--hash-cost', type=int, default=12)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes.split(','):
+        fake = FakeTelegram(delay=args.telegram_delay_ms / 1000).start()
+        configure_environment(args, fake.url)
+        log_path = os.path.join(os.path.dirname(os.environ['DATABASE_PATH']), f'{mode}.log')
+        process, base = launch(mode, args, log_path)
+        print(f"{mode}: {base}, лог {log_path}", file=sys.stderr)
+        try:
+            wait_ready(process, base, fake)
+            results[mode] = run_phases(base, args, fake, webhook=True)
+        finally:
+            stop(process)
+            fake.stop()
+
+    print(json.dumps({
+        'cpus': os.cpu_count(),
+        'workers': args.workers,
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'hash_cost': args.hash_cost,
+        'results': results,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
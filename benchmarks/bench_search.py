@@ -0,0 +1,105 @@
+"""
+Поиск заказов в админке: индекс FTS5 (repository.get_orders_page(search=...)) против
+LIKE по всей таблице на синтетической базе.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_search --orders 1000000 --clients 100000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+SERVICES = ('Замена масла', 'Регулировка цепи', 'Ремонт двигателя', 'Помощь на дороге')
+NAMES = ('Иван', 'Пётр', 'Алексей', 'Мария', 'Ольга', 'Дмитрий', 'Сергей', 'Анна', 'Никита', 'Елена')
+
+LIKE_QUERY = '''
+    SELECT orders.id FROM orders JOIN clients ON orders.user_id = clients.id
+    WHERE clients.username LIKE ? OR clients.phone LIKE ? OR orders.service LIKE ?
+    ORDER BY orders.timestamp DESC, orders.id DESC LIMIT ?
+'''
+DROP_SEARCH_INDEX = (
+    'DROP TRIGGER IF EXISTS orders_fts_insert',
+    'DROP TRIGGER IF EXISTS orders_fts_delete',
+    'DROP TRIGGER IF EXISTS orders_fts_update',
+    'DROP TRIGGER IF EXISTS clients_fts_update',
+    'DROP TABLE IF EXISTS orders_fts',
+)
+
+
+def populate(repository, clients, orders):
+    rng = random.Random(42)
+    with repository.db.transaction() as cursor:
+        cursor.executemany(
+            repository.INSERT_CLIENT,
+            ((f'{rng.choice(NAMES)} {i}', 'x', f'+7 (9{i % 100:02d}) {i:07d}') for i in range(clients))
+        )
+    batch = 100000
+    for offset in range(0, orders, batch):
+        with repository.db.transaction() as cursor:
+            cursor.executemany(
+                'INSERT INTO orders (user_id, service, timestamp) '
+                "VALUES (?, ?, datetime('2024-01-01', ? || ' minutes'))",
+                ((rng.randint(1, clients), rng.choice(SERVICES), i)
+                 for i in range(offset, min(orders, offset + batch)))
+            )
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - started)
+    return result, round(statistics.median(latencies) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--clients', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='bench_search_')
+    os.environ['DATABASE_PATH'] = os.path.join(tmpdir, 'orders.db')
+    import repository
+    import migrations
+
+    # Полная схема, затем поисковый индекс снимается: сначала данные, потом построение индекса.
+    # MIGRATIONS не трогаем — бенчмарк не зависит от номеров и порядка миграций
+    migrations.migrate()
+    with repository.db.transaction() as cursor:
+        for statement in DROP_SEARCH_INDEX:
+            cursor.execute(statement)
+    started = time.perf_counter()
+    populate(repository, args.clients, args.orders)
+    populate_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with repository.db.transaction() as cursor:
+        migrations.create_search_index(cursor)
+    index_s = time.perf_counter() - started
+
+    queries = ('Мария', 'мар', 'Мария 12', '4567', '+7 (912) 0001', 'цепи', 'нет такого')
+    results = {
+        'orders': args.orders,
+        'clients': args.clients,
+        'populate_s': round(populate_s, 1),
+        'build_index_s': round(index_s, 1),
+        'queries': {},
+    }
+    for query in queries:
+        (rows, _), fts_ms = timed(lambda: repository.get_orders_page(args.limit, search=query), args.repeat)
+        like = f'%{query}%'
+        _, like_ms = timed(lambda: repository.db.fetchall(LIKE_QUERY, (like, like, like, args.limit)), args.repeat)
+        results['queries'][query] = {'rows': len(rows), 'fts_ms': fts_ms, 'like_scan_ms': like_ms}
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
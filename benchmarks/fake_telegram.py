@@ -0,0 +1,165 @@
+"""
+Локальная замена api.telegram.org для бенчмарков.
+
+BotApi отвечает на методы Bot API, которые вызывают outbox и python-telegram-bot (getMe,
+sendMessage, deleteMessage, setWebhook, getUpdates, ...), и считает вызовы. Поверх него:
+
+- FakeTelegram — HTTP-сервер с задержкой или ошибкой в ответах; приложение направляется
+  сюда через TELEGRAM_API_URL:
+
+    server = FakeTelegram(delay=0.05).start()
+    os.environ['TELEGRAM_API_URL'] = server.url
+
+- StubRequest — запросы python-telegram-bot без сети, для ApplicationBuilder.request().
+  getUpdates отдаёт обновления, добавленные через BotApi.push_updates().
+"""
+import sys
+import json
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from telegram.request import BaseRequest
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+class BotApi:
+    def __init__(self):
+        self.calls = Counter()
+        self.updates = deque()
+        self._message_id = 0
+        self._lock = threading.Lock()
+
+    def push_updates(self, updates):
+        """Обновления (словари Bot API), которые вернёт следующий getUpdates"""
+        self.updates.extend(updates)
+
+    def call(self, method: str, params: dict):
+        self.calls[method] += 1
+        return self.result(method, params)
+
+    def result(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'editMessageText'):
+            with self._lock:
+                self._message_id += 1
+                message_id = self._message_id
+            chat_id = params.get('chat_id', 0)
+            return {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(chat_id) if str(chat_id).lstrip('-').isdigit() else 0, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+        if method == 'getUpdates':
+            limit = int(params.get('limit') or 100)
+            batch = []
+            while self.updates and len(batch) < limit:
+                batch.append(self.updates.popleft())
+            return batch
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        return True
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server.fake
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            params = json.loads(body or b'{}')
+        else:
+            params = dict(parse_qsl(body.decode()))
+        method = self.path.rsplit('/', 1)[-1]
+        if server.delay:
+            time.sleep(server.delay)
+
+        if server.status != 200:
+            server.api.calls[method] += 1
+            payload = {'ok': False, 'error_code': server.status, 'description': 'fake error',
+                       'parameters': {'retry_after': 1}}
+        else:
+            payload = {'ok': True, 'result': server.api.call(method, params)}
+        data = json.dumps(payload).encode()
+        self.send_response(server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Клиент, остановленный посреди запроса (конец прогона), — не ошибка фейкового API
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeTelegram:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, delay: float = 0.0, status: int = 200):
+        self.delay = delay
+        self.status = status
+        self.api = BotApi()
+        self._server = Server((host, port), Handler)
+        self._server.fake = self
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def calls(self) -> Counter:
+        return self.api.calls
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name='fake-telegram', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StubRequest(BaseRequest):
+    """Запросы Bot API без сети: ответ BotApi после необязательной задержки.
+
+    Пустой getUpdates ждёт poll_interval, чтобы Updater не крутился вхолостую.
+    """
+
+    def __init__(self, api: BotApi, delay: float = 0.0, poll_interval: float = 0.01):
+        self.api = api
+        self.delay = delay
+        self.poll_interval = poll_interval
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        result = self.api.call(name, params)
+        if name == 'getUpdates' and not result:
+            await asyncio.sleep(self.poll_interval)
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
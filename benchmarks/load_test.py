@@ -0,0 +1,259 @@
+"""
+Нагрузочный тест HTTP-эндпоинтов на временной базе и локальной замене Telegram API.
+
+Поднимает create_app() (--target app) или приложение из main.py вместе с ботом в режиме
+webhook (--target main) на свободном порту и гоняет по очереди фазы /register, /login,
+/order, /admin и /webhook (только main) с заданной параллельностью. Результат — JSON
+с p50/p95/p99 и пропускной способностью по каждой фазе; --output сохраняет его в файл,
+чтобы сравнивать прогоны между коммитами.
+
+Запуск из корня проекта:
+    python -m benchmarks.load_test --target main --users 200 --concurrency 16 --orders 5
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.stats import percentile
+
+ADMIN_PASSWORD = 'bench-admin'
+WEBHOOK_SECRET = 'bench-secret'
+SERVICES = ('Замена масла', 'Регулировка цепи', 'Ремонт двигателя', 'Помощь на дороге')
+
+
+def summarize(latencies, errors, elapsed):
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(statistics.median(latencies) * 1000, 2),
+            'p95': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99': round(percentile(latencies, 0.99) * 1000, 2),
+            'max': round(max(latencies) * 1000, 2),
+        },
+    }
+
+
+def configure_environment(args, fake_url):
+    """Переменные окружения до импорта приложения: свои значения поверх .env"""
+    tmpdir = tempfile.mkdtemp(prefix='load_test_')
+    os.environ.update({
+        'DATABASE_PATH': os.path.join(tmpdir, 'orders.db'),
+        'TELEGRAM_API_URL': fake_url,
+        'TELEGRAM_BOT_TOKEN': '123456:load-test',
+        'TELEGRAM_CHAT_ID': '1',
+        'ADMIN_PASSWORD': ADMIN_PASSWORD,
+        'WEBHOOK_SECRET': WEBHOOK_SECRET,
+        'FLASK_SECRET_KEY': 'load-test',
+        'IS_RENDER': 'false',
+        # Все клиенты теста приходят с 127.0.0.1: ограничение частоты мерило бы само себя
+        'RATE_LIMIT_ENABLED': 'false',
+        # Фаза /webhook ждёт доставки уведомлений о заказах: лимит чата растянул бы её на минуты
+        'OUTBOX_CHAT_RATE': '0',
+    })
+    if args.hash_cost:
+        os.environ['PASSWORD_HASH_COST'] = str(args.hash_cost)
+
+
+def boot(target):
+    """Импортирует приложение; для main ещё и запускает бота в режиме webhook"""
+    if target == 'app':
+        from app import create_app
+        return create_app(), None
+
+    import main
+    from telegram_bot import bot_manager
+    main.start_webhook_thread()
+    deadline = time.monotonic() + 30
+    while not (bot_manager.application and bot_manager.application.running):
+        if time.monotonic() > deadline:
+            raise RuntimeError("Бот не запустился за 30 с")
+        time.sleep(0.05)
+    return main.app, bot_manager
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def new_session(concurrency):
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+    return session
+
+
+def run_phase(name, jobs, concurrency, expected=(200, 302)):
+    """Выполняет jobs (функции без аргументов, возвращающие Response) параллельно"""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def run(job):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = job().status_code in expected
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, jobs))
+    result = summarize(latencies, errors, time.perf_counter() - started)
+    print(f"{name}: {result}", file=sys.stderr)
+    return result
+
+
+def repository_pending() -> int:
+    """Неотправленные уведомления; своё соединение, чтобы работать и с сервером в другом процессе"""
+    with closing(sqlite3.connect(os.environ['DATABASE_PATH'])) as conn:
+        return conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+
+def make_update(update_id, chat_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'User {chat_id}'},
+            'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+        },
+    }
+
+
+def run_phases(base, args, fake, webhook=False) -> dict:
+    """Фазы нагрузки против сервера по адресу base; /webhook — если бот принимает вебхуки"""
+    sessions = [new_session(args.concurrency) for _ in range(args.users)]
+    users = [(f'bench{i}', f'+7999{i:07d}', 'bench-password') for i in range(args.users)]
+    phases = {}
+
+    phases['register'] = run_phase('register', [
+        lambda s=session, u=user: s.post(f'{base}/register', allow_redirects=False,
+                                        data={'username': u[0], 'phone': u[1], 'password': u[2]})
+        for session, user in zip(sessions, users)
+    ], args.concurrency)
+
+    phases['login'] = run_phase('login', [
+        lambda s=session, u=user: s.post(f'{base}/login', allow_redirects=False,
+                                        data={'username': u[0], 'password': u[2]})
+        for session, user in zip(sessions, users)
+    ], args.concurrency)
+
+    phases['order'] = run_phase('order', [
+        lambda s=session, n=n: s.post(f'{base}/order', allow_redirects=False,
+                                     data={'service': SERVICES[n % len(SERVICES)]})
+        for n in range(args.orders) for session in sessions
+    ], args.concurrency)
+
+    # Вход в админку не измеряется: это подготовка к фазе /admin
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda s: s.post(f'{base}/admin', data={'password': ADMIN_PASSWORD},
+                                       allow_redirects=False), sessions))
+    phases['admin'] = run_phase('admin', [
+        lambda s=session: s.get(f'{base}/admin')
+        for _ in range(args.admin_views) for session in sessions
+    ], args.concurrency, expected=(200,))
+
+    if webhook:
+        webhook_session = new_session(args.concurrency)
+        # Уведомления о заказах из фазы /order не должны попасть в счёт ответов бота
+        deadline = time.monotonic() + 60
+        while repository_pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        sends_before = fake.calls['sendMessage']
+        started = time.perf_counter()
+        phases['webhook'] = run_phase('webhook', [
+            lambda n=n: webhook_session.post(
+                f'{base}/webhook', json=make_update(n + 1, 100000 + n),
+                headers={'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET})
+            for n in range(args.updates)
+        ], args.concurrency, expected=(200,))
+        # Каждый /start из нового чата — один sendMessage (повторный /start в открытом диалоге
+        # бот игнорирует); ждём, пока бот разберёт очередь
+        deadline = time.monotonic() + 120
+        while fake.calls['sendMessage'] - sends_before < args.updates and time.monotonic() < deadline:
+            time.sleep(0.01)
+        processed = fake.calls['sendMessage'] - sends_before
+        elapsed = time.perf_counter() - started
+        phases['webhook']['bot_processed'] = processed
+        phases['webhook']['bot_updates_per_sec'] = round(processed / elapsed, 1)
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=('app', 'main'), default='app')
+    parser.add_argument('--users', type=int, default=100, help='виртуальных пользователей')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=5, help='заказов на пользователя')
+    parser.add_argument('--admin-views', type=int, default=2, help='просмотров /admin на пользователя')
+    parser.add_argument('--updates', type=int, default=1000, help='вебхуков (только --target main)')
+    parser.add_argument('--telegram-delay-ms', type=float, default=50, help='задержка ответа фейкового Telegram')
+    parser.add_argument('--hash-cost', type=int, help='PASSWORD_HASH_COST для прогона')
+    parser.add_argument('--output', help='куда сохранить JSON')
+    args = parser.parse_args()
+
+    fake = FakeTelegram(delay=args.telegram_delay_ms / 1000).start()
+    configure_environment(args, fake.url)
+    app, bot_manager = boot(args.target)
+    server, base = serve(app)
+
+    phases = run_phases(base, args, fake, webhook=bot_manager is not None)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    report = {
+        'commit': commit,
+        'target': args.target,
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'telegram_delay_ms': args.telegram_delay_ms,
+        'hash_cost': int(os.environ.get('PASSWORD_HASH_COST', 0)) or None,
+        'phases': phases,
+        'telegram_calls': dict(fake.calls),
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+    server.shutdown()
+    fake.stop()
+    import passwords
+    passwords.hasher.shutdown()
+    # Цикл бота и диспетчер уведомлений — потоки-демоны без штатной остановки
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+"""Общие вычисления для бенчмарков."""
+
+
+def percentile(values, fraction):
+    """Значение, ниже которого лежит доля fraction выборки (метод ближайшего ранга)"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
@@ -0,0 +1,284 @@
+"""
+Сборка статики для шаблонов.
+
+1. Для каждого файла из static/images создаёт уменьшенные копии нескольких ширин
+   в форматах AVIF (если Pillow его поддерживает), WebP и JPEG/PNG с хэшем содержимого
+   в имени и записывает манифест static/build/images.json. Повторный запуск
+   пересобирает только изменившиеся исходники — или все, если поменялись ширины,
+   форматы или параметры кодеков.
+2. Копирует остальную статику в static/build/static/ с хэшем содержимого в имени
+   (ссылки url() в CSS переписываются), рядом кладёт сжатые .gz и .br (если установлен
+   пакет brotli) и пишет манифест static/build/static.json для url_for('static').
+
+    python build_assets.py            # инкрементальная сборка
+    python build_assets.py --force    # пересобрать всё
+    python build_assets.py --logo     # сначала перерисовать logo.png (create_logo.py)
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+
+from PIL import Image
+
+try:
+    import pillow_avif  # noqa: F401  регистрирует кодек AVIF в Pillow
+except ImportError:
+    pillow_avif = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SOURCE_DIR = 'static/images'
+OUTPUT_DIR = 'static/build/images'
+MANIFEST_PATH = 'static/build/images.json'
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Иконка нужна только для сборки логотипа
+SKIP_SOURCES = ('motocycle.png',)
+
+STATIC_DIR = 'static'
+FINGERPRINT_DIR = 'static/build/static'
+STATIC_MANIFEST_PATH = 'static/build/static.json'
+# Текстовые файлы, для которых имеет смысл держать сжатые копии
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.map')
+CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+WIDTHS = (160, 320, 640, 960, 1280, 1920, 2560)
+# Параметры кодеков по форматам; входят в отпечаток настроек сборки
+ENCODER_OPTIONS = {
+    'avif': {'quality': 50},
+    'webp': {'quality': 80},
+    'jpeg': {'quality': 82, 'optimize': True, 'progressive': True},
+    'png': {'optimize': True},
+}
+RESAMPLE = 'LANCZOS'
+EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg', 'png': 'png'}
+
+
+def available_formats():
+    Image.init()
+    return [fmt for fmt in ('avif', 'webp') if fmt.upper() in Image.SAVE]
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def target_widths(width):
+    """Ширины из WIDTHS меньше исходной плюс сама исходная — увеличивать смысла нет"""
+    return [w for w in WIDTHS if w < width] + [width]
+
+
+def build_fingerprint(formats):
+    """Хэш настроек сборки: ширины, форматы, параметры кодеков и ресемплинга.
+    Если он не совпадает с записанным в манифесте, изображение пересобирается"""
+    config = {
+        'widths': WIDTHS,
+        'formats': sorted(formats),
+        'encoders': ENCODER_OPTIONS,
+        'resample': RESAMPLE,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image = image.convert('RGB')
+    image.save(buffer, fmt.upper(), **ENCODER_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def build_image(name, source_path, formats):
+    """Собирает все варианты одного исходника; возвращает запись манифеста"""
+    stem = os.path.splitext(name)[0]
+    with Image.open(source_path) as source:
+        source.load()
+        has_alpha = source.mode in ('RGBA', 'LA') or 'transparency' in source.info
+        image = source.convert('RGBA' if has_alpha else 'RGB')
+
+    fallback = 'png' if has_alpha else 'jpeg'
+    variants = {fmt: [] for fmt in formats + [fallback]}
+    for width in target_widths(image.width):
+        height = round(image.height * width / image.width)
+        resized = image if width == image.width else image.resize((width, height), getattr(Image, RESAMPLE))
+        for fmt in variants:
+            data = encode(resized, fmt)
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            filename = f'{stem}-{width}w.{digest}.{EXTENSIONS[fmt]}'
+            with open(os.path.join(OUTPUT_DIR, filename), 'wb') as f:
+                f.write(data)
+            variants[fmt].append({'width': width, 'path': f'build/images/{filename}', 'bytes': len(data)})
+
+    return {
+        'width': image.width,
+        'height': image.height,
+        'fallback': fallback,
+        'variants': variants,
+    }
+
+
+def entry_files(entry):
+    return [variant['path'] for variants in entry['variants'].values() for variant in variants]
+
+
+def is_fresh(entry, digest, formats, fingerprint):
+    if not entry or entry.get('source_hash') != digest or entry.get('build_hash') != fingerprint:
+        return False
+    if set(entry['variants']) != set(formats + [entry['fallback']]):
+        return False
+    return all(os.path.exists(os.path.join('static', path)) for path in entry_files(entry))
+
+
+def build_images(force=False):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    formats = available_formats()
+    fingerprint = build_fingerprint(formats)
+    if pillow_avif is None and 'avif' not in formats:
+        print("AVIF пропущен: установите pillow-avif-plugin")
+
+    sources = sorted(
+        name for name in os.listdir(SOURCE_DIR)
+        if name.lower().endswith(SOURCE_EXTENSIONS) and name not in SKIP_SOURCES
+    )
+    result = {}
+    for name in sources:
+        key = f'images/{name}'
+        source_path = os.path.join(SOURCE_DIR, name)
+        digest = file_digest(source_path)
+        previous = manifest.get(key)
+
+        if not force and is_fresh(previous, digest, formats, fingerprint):
+            result[key] = previous
+            continue
+
+        entry = build_image(name, source_path, formats)
+        entry['source_hash'] = digest
+        entry['build_hash'] = fingerprint
+        result[key] = entry
+        print(f"{key}: {sum(len(v) for v in entry['variants'].values())} вариантов")
+
+    # Удаляем файлы, которые больше не упоминаются в манифесте
+    referenced = {os.path.basename(path) for entry in result.values() for path in entry_files(entry)}
+    for filename in os.listdir(OUTPUT_DIR):
+        if filename not in referenced:
+            os.remove(os.path.join(OUTPUT_DIR, filename))
+
+    tmp_path = MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+    print(f"Манифест записан: {MANIFEST_PATH} ({len(result)} изображений)")
+
+
+def fingerprinted_name(path, data):
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}'
+
+
+def rewrite_css_urls(path, data, manifest):
+    """Заменяет url() в CSS на относительные ссылки на уже отпечатанные файлы"""
+    css_dir = os.path.dirname(path)
+    target_dir = os.path.dirname(os.path.join('build/static', path))
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '/', '#')):
+            return match.group(0)
+        reference = os.path.normpath(os.path.join(css_dir, url)).replace(os.sep, '/')
+        if reference not in manifest:
+            return match.group(0)
+        relative = os.path.relpath(manifest[reference], target_dir).replace(os.sep, '/')
+        return f'url({quote}{relative}{quote})'
+
+    return CSS_URL.sub(replace, data.decode('utf-8')).encode('utf-8')
+
+
+def write_compressed(path, data):
+    """Кладёт рядом .gz и .br, если они действительно меньше оригинала"""
+    written = []
+    compressed = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(compressed) < len(data):
+        with open(path + '.gz', 'wb') as f:
+            f.write(compressed)
+        written.append(path + '.gz')
+    if brotli is not None:
+        compressed = brotli.compress(data, quality=11)
+        if len(compressed) < len(data):
+            with open(path + '.br', 'wb') as f:
+                f.write(compressed)
+            written.append(path + '.br')
+    return written
+
+
+def build_static():
+    """Отпечатки содержимого для всей статики вне static/build"""
+    sources = []
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != os.path.join(STATIC_DIR, 'build')]
+        for name in files:
+            sources.append(os.path.relpath(os.path.join(root, name), STATIC_DIR).replace(os.sep, '/'))
+    # CSS в конце: к этому моменту уже известны имена файлов, на которые он ссылается
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+    if brotli is None:
+        print("Brotli пропущен: установите пакет brotli")
+
+    manifest, written = {}, set()
+    for path in sources:
+        with open(os.path.join(STATIC_DIR, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = rewrite_css_urls(path, data, manifest)
+
+        target = fingerprinted_name(os.path.join('build/static', path), data).replace(os.sep, '/')
+        target_path = os.path.join(STATIC_DIR, target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if not os.path.exists(target_path):
+            with open(target_path, 'wb') as f:
+                f.write(data)
+        written.add(os.path.normpath(target_path))
+        if path.endswith(COMPRESSIBLE_EXTENSIONS):
+            written.update(os.path.normpath(p) for p in write_compressed(target_path, data))
+        manifest[path] = target
+
+    for root, _, files in os.walk(FINGERPRINT_DIR):
+        for name in files:
+            path = os.path.normpath(os.path.join(root, name))
+            if path not in written:
+                os.remove(path)
+
+    tmp_path = STATIC_MANIFEST_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, STATIC_MANIFEST_PATH)
+    print(f"Манифест записан: {STATIC_MANIFEST_PATH} ({len(manifest)} файлов)")
+
+
+def build(force=False):
+    build_images(force=force)
+    build_static()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--force', action='store_true', help='пересобрать все изображения')
+    parser.add_argument('--logo', action='store_true', help='перерисовать static/images/logo.png')
+    args = parser.parse_args()
+
+    if args.logo:
+        from create_logo import create_logo
+        create_logo()
+    build(force=args.force)
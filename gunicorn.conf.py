@@ -0,0 +1,23 @@
+"""
+Настройки gunicorn для server.py: сайт в пре-форкнутых воркерах, бот — в процессе server.py.
+"""
+import os
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Воркер на ядро (GIL не даёт одному процессу занять больше), потоки — для ожидания SQLite и сети
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '4'))
+
+# Каждый воркер импортирует приложение сам: в мастере нет соединений SQLite и фоновых потоков
+preload_app = False
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = None
+errorlog = '-'
+loglevel = 'info'
@@ -1,15 +1,23 @@
 import os
-import logging
-import asyncio
+import sys
+import json
 import time
+import asyncio
+import logging
+import threading
 from threading import Thread
-from flask import Flask, request, jsonify
-from telegram import Update
-from dotenv import load_dotenv
-import tracemalloc
+import profiling
 
-# Инициализация трекинга памяти
-tracemalloc.start()
+# tracemalloc выключен по умолчанию: включается из админки или переменной TRACEMALLOC_FRAMES
+profiling.start_from_env()
+startup = profiling.startup
+
+# python main.py --startup-profile: время фаз холодного старта без запуска серверов
+STARTUP_PROFILE = '--startup-profile' in sys.argv
+
+with startup.phase('import flask'):
+    from flask import request, jsonify
+    from dotenv import load_dotenv
 
 # Настройка логгирования
 logging.basicConfig(
@@ -33,15 +41,30 @@ if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN не найден в .env файле!")
 
 # Инициализация Flask приложения
-from app import create_app
+with startup.phase('import app'):
+    from app import create_app
+    from webhook_server import webhook_response
+    import repository
+    import ratelimit
+
+with startup.phase('create_app'):
+    app = create_app()
 
-app = create_app()
+# Бот (python-telegram-bot, BotManager, Application) импортируется и собирается в своём потоке
+# при запуске, а не при импорте main.py: сайт начинает отвечать, не дожидаясь его
+bot_manager = None
+_bot_lock = threading.Lock()
 
-# Импорт из telegram_bot
-from telegram_bot import init_bot, run_polling, bot_manager
 
-# Инициализация бота
-bot_application = init_bot()
+def get_bot_manager():
+    """Импортирует telegram_bot при первом обращении и возвращает BotManager"""
+    global bot_manager
+    with _bot_lock:
+        if bot_manager is None:
+            with startup.phase('import telegram_bot'):
+                import telegram_bot
+            bot_manager = telegram_bot.bot_manager
+    return bot_manager
 
 
 @app.route('/webhook', methods=['POST'])
@@ -49,32 +72,48 @@ def telegram_webhook():
     if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
         return "Unauthorized", 403
 
-    try:
-        update = Update.de_json(request.get_json(), bot_manager.application.bot)
-        bot_manager.put_update(update)
-        return "OK", 200
-    except Exception as e:
-        logging.error(f"Webhook error: {e}")
-        return "Error", 500
+    # Пока бот не загружен, отвечаем 503: Telegram повторит доставку
+    if bot_manager is None:
+        return webhook_response(503)
+    # Только разбор JSON и постановка в очередь бота: ответ не ждёт обработки обновления
+    return webhook_response(bot_manager.submit_update(request.get_data()))
+
+
+webhook_thread = None
 
 
 def run_webhook_thread():
     """Запуск бота в отдельном потоке"""
-    bot_manager.run_webhook(RENDER_HOSTNAME, PORT, WEBHOOK_SECRET)
+    get_bot_manager().run_webhook(RENDER_HOSTNAME, PORT, WEBHOOK_SECRET)
+
+
+def run_polling_thread():
+    """Запуск бота в режиме polling в отдельном потоке"""
+    asyncio.run(get_bot_manager().run_polling())
+
 
+def start_webhook_thread():
+    """Запускает цикл бота в режиме webhook (один раз на процесс)"""
+    global webhook_thread
+    if webhook_thread is None:
+        webhook_thread = Thread(target=run_webhook_thread, daemon=True)
+        webhook_thread.start()
 
-if IS_RENDER:
-    Thread(target=run_webhook_thread, daemon=True).start()
+
+if IS_RENDER and not STARTUP_PROFILE:
+    start_webhook_thread()
 
 @app.route('/test-bot')
 def test_bot():
     """Проверка состояния бота"""
     try:
+        manager = get_bot_manager()
         return jsonify({
             "status": "running",
-            "queue_size": bot_manager.application.update_queue.qsize(),
+            "queue_size": manager.application.update_queue.qsize(),
+            "queue_depths": manager.queue_depths(),
             "webhook": IS_RENDER,
-            "bot_initialized": hasattr(bot_manager, 'application')
+            "bot_initialized": manager.application is not None
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -84,6 +123,8 @@ def test_bot():
 def test_message():
     """Тест обработки сообщения"""
     try:
+        from telegram import Update
+        manager = get_bot_manager()
         test_update = {
             "update_id": 999999999,
             "message": {
@@ -93,8 +134,8 @@ def test_message():
                 "date": int(time.time())
             }
         }
-        update = Update.de_json(test_update, bot_manager.application.bot)
-        bot_manager.application.update_queue.put_nowait(update)
+        update = Update.de_json(test_update, manager.application.bot)
+        manager.application.update_queue.put_nowait(update)
         return jsonify({"status": "test message queued"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -106,10 +147,16 @@ def healthcheck():
     return jsonify({
         "status": "ok",
         "mode": "webhook" if IS_RENDER else "polling",
-        "bot_ready": hasattr(bot_manager, 'application')
+        "bot_ready": bool(bot_manager and bot_manager.application and bot_manager.application.running),
+        "client_cache": repository.client_cache.stats(),
+        "order_writer": repository.order_writer.stats(),
+        "rate_limits": ratelimit.stats()
     }), 200
 
 
+logger.info(f"Приложение загружено за {startup.report()['elapsed_ms']} мс: {startup.summary()}")
+
+
 def run_flask():
     """Запуск Flask сервера"""
     app.run(
@@ -119,35 +166,34 @@ def run_flask():
         use_reloader=False,
         threaded=True
     )
-def run_webhook_wrapper():
-    """Обертка для запуска webhook в отдельном потоке"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(bot_manager.run_webhook(
-            RENDER_HOSTNAME, PORT, WEBHOOK_SECRET
-        ))
-    except Exception as e:
-        logger.error(f"Webhook failed: {e}")
-    finally:
-        loop.close()
+
+
+def profile_startup():
+    """Проходит отложенные фазы (бот, первые запросы) без сети и печатает отчёт в JSON"""
+    manager = get_bot_manager()
+    with startup.phase('build bot application'):
+        manager.init_bot()
+    client = app.test_client()
+    for path in ('/healthcheck', '/'):
+        with startup.phase(f'first request {path}'):
+            client.get(path)
+    print(json.dumps(startup.report(), ensure_ascii=False, indent=2))
+
 
 def main():
-    if IS_RENDER:
-        logger.info("Starting in WEBHOOK mode")
+    if STARTUP_PROFILE:
+        profile_startup()
+        return
 
-        # Инициализация обработчика очереди
-        def start_webhook():
-            asyncio.run(bot_manager.run_webhook(
-                RENDER_HOSTNAME,
-                PORT,
-                WEBHOOK_SECRET
-            ))
+    import archive
+    archive.archiver.start()
 
-        Thread(target=start_webhook, daemon=True).start()
+    if IS_RENDER:
+        logger.info("Starting in WEBHOOK mode")
+        start_webhook_thread()
     else:
         logger.info("Starting in POLLING mode")
-        Thread(target=run_polling, daemon=True).start()
+        Thread(target=run_polling_thread, daemon=True).start()
 
     run_flask()
 
@@ -0,0 +1,201 @@
+import threading
+from bisect import bisect_left
+
+# Границы корзин гистограмм задержек, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Ограничение числа рядов на метрику: лишние комбинации меток попадают в ряд 'other'
+MAX_SERIES = 200
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+registry = []
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Метрика с шардом на каждый поток.
+
+    Запись идёт только в словарь своего потока, без блокировок; блокировка берётся
+    один раз при первом обращении потока и при сборе. Шарды завершившихся потоков
+    при сборе сливаются в общий итог, поэтому их число не растёт.
+    """
+    type = None
+
+    def __init__(self, name: str, documentation: str, labels=(), max_series: int = MAX_SERIES):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.max_series = max_series
+        self._series = set()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _key(self, values: tuple) -> tuple:
+        if values in self._series:
+            return values
+        with self._lock:
+            if len(self._series) < self.max_series:
+                self._series.add(values)
+                return values
+        return ('other',) * len(values)
+
+    def _merge(self, total: dict, shard: dict):
+        raise NotImplementedError
+
+    def collect(self) -> dict:
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            total = {}
+            self._merge(total, self._retired)
+            for _, shard in alive:
+                self._merge(total, shard.copy())
+        return total
+
+    def render(self) -> list:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *label_values, amount: float = 1):
+        shard = self._shard()
+        key = self._key(label_values)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _merge(self, total, shard):
+        for key, value in shard.items():
+            total[key] = total.get(key, 0) + value
+
+    def render(self):
+        lines = super().render()
+        for key, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{format_labels(self.labels, key)} {format_value(value)}')
+        return lines
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, max_series=MAX_SERIES):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labels, max_series)
+
+    def observe(self, value: float, *label_values):
+        shard = self._shard()
+        key = self._key(label_values)
+        # По корзине на каждую границу и одна для +Inf, затем сумма и количество
+        series = shard.get(key)
+        if series is None:
+            series = shard[key] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def _merge(self, total, shard):
+        for key, series in shard.items():
+            target = total.get(key)
+            if target is None:
+                total[key] = list(series)
+            else:
+                for index, value in enumerate(series):
+                    target[index] += value
+
+    def render(self):
+        lines = super().render()
+        for key, series in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                labels = format_labels(self.labels, key, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {format_value(series[-2])}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+class Gauge(Metric):
+    """Значение вычисляется при сборе: callback возвращает {кортеж меток: значение}"""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def collect(self):
+        try:
+            return dict(self.callback()) if self.callback else {}
+        except Exception:
+            return {}
+
+    def render(self):
+        lines = super().render()
+        for key, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{format_labels(self.labels, key)} {format_value(value)}')
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Метрики приложения (описаны здесь, чтобы модули не импортировали друг друга ради счётчиков)
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса Flask', ('route', 'method', 'status')
+)
+sqlite_statement_duration = Histogram(
+    'sqlite_statement_duration_seconds', 'Время выполнения SQL-выражения', ('statement',)
+)
+telegram_api_duration = Histogram(
+    'telegram_api_request_duration_seconds', 'Время запроса к Telegram Bot API', ('method',)
+)
+telegram_api_errors = Counter(
+    'telegram_api_errors_total', 'Ошибки запросов к Telegram Bot API', ('method', 'reason')
+)
+bot_update_duration = Histogram(
+    'bot_update_duration_seconds', 'Время обработки одного обновления бота', ('shard',)
+)
+orders_created = Counter(
+    'orders_created_total', 'Созданные заказы', ('service', 'source')
+)
+rate_limited = Counter(
+    'rate_limited_total', 'Запросы, отклонённые ограничителем частоты', ('route',)
+)
+outbox_sent = Counter(
+    'outbox_sent_total', 'Доставленные уведомления outbox: по одному или в сводке', ('delivery',)
+)
@@ -0,0 +1,263 @@
+import logging
+import threading
+import repository
+import outbox
+
+logger = logging.getLogger(__name__)
+
+CREATE_SCHEMA_VERSION = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def columns(cursor, table: str) -> list:
+    return [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+
+
+def has_unique_index(cursor, table: str, column: str) -> bool:
+    """Есть ли уникальный индекс (или ограничение UNIQUE) ровно по одному столбцу"""
+    for _, index_name, unique, *_ in cursor.execute(f'PRAGMA index_list({table})').fetchall():
+        if unique and [row[2] for row in cursor.execute(f'PRAGMA index_info({index_name})')] == [column]:
+            return True
+    return False
+
+
+def unique_or_plain_index(cursor, table: str, column: str):
+    """UNIQUE-индекс по столбцу; если в старых данных есть дубли — обычный индекс и предупреждение"""
+    if has_unique_index(cursor, table, column):
+        return
+    index_name = f'idx_{table}_{column}'
+    duplicates = cursor.execute(
+        f'SELECT COUNT(*) FROM (SELECT 1 FROM {table} GROUP BY {column} HAVING COUNT(*) > 1)'
+    ).fetchone()[0]
+    if duplicates:
+        logger.warning(f"{table}.{column}: {duplicates} повторяющихся значений, создаётся неуникальный индекс")
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({column})')
+    else:
+        cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table} ({column})')
+
+
+def create_base_tables(cursor):
+    """Таблицы clients и orders; приводит к общему виду схему, созданную ботом"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS clients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            phone TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            service TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES clients (id)
+        )
+    ''')
+    # Прежняя схема бота называла столбец created_at
+    order_columns = columns(cursor, 'orders')
+    if 'timestamp' not in order_columns and 'created_at' in order_columns:
+        cursor.execute('ALTER TABLE orders RENAME COLUMN created_at TO timestamp')
+
+
+def create_indexes(cursor):
+    """Индексы под горячие запросы: вход и регистрация, заказы клиента, список заказов"""
+    unique_or_plain_index(cursor, 'clients', 'username')
+    unique_or_plain_index(cursor, 'clients', 'phone')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders (timestamp)')
+
+
+def create_outbox(cursor):
+    cursor.execute(outbox.CREATE_OUTBOX)
+    cursor.execute(outbox.CREATE_OUTBOX_INDEX)
+
+
+def add_outbox_chats(cursor):
+    """Расписание отправки по чатам и признак отправки без сводки"""
+    cursor.execute(outbox.CREATE_OUTBOX_CHATS)
+    if 'single' not in columns(cursor, 'outbox'):
+        cursor.execute(outbox.ADD_OUTBOX_SINGLE)
+
+
+def create_stats(cursor):
+    """Сводки для дашборда по часам (UTC), которые поддерживают триггеры.
+
+    Часовые корзины позволяют свернуть их в дни любого часового пояса с целым сдвигом.
+    Даты регистрации старых клиентов не хранились, поэтому для них берётся час первого заказа.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_stats (
+            hour TEXT NOT NULL,
+            service TEXT NOT NULL,
+            orders INTEGER NOT NULL,
+            PRIMARY KEY (hour, service)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS client_stats (
+            hour TEXT PRIMARY KEY,
+            clients INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS order_stats_insert AFTER INSERT ON orders BEGIN
+            INSERT INTO order_stats (hour, service, orders)
+            VALUES (strftime('%Y-%m-%d %H:00:00', COALESCE(NEW.timestamp, CURRENT_TIMESTAMP)), NEW.service, 1)
+            ON CONFLICT (hour, service) DO UPDATE SET orders = orders + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS order_stats_delete AFTER DELETE ON orders BEGIN
+            UPDATE order_stats SET orders = orders - 1
+            WHERE hour = strftime('%Y-%m-%d %H:00:00', OLD.timestamp) AND service = OLD.service;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS order_stats_update AFTER UPDATE OF service, timestamp ON orders BEGIN
+            UPDATE order_stats SET orders = orders - 1
+            WHERE hour = strftime('%Y-%m-%d %H:00:00', OLD.timestamp) AND service = OLD.service;
+            INSERT INTO order_stats (hour, service, orders)
+            VALUES (strftime('%Y-%m-%d %H:00:00', NEW.timestamp), NEW.service, 1)
+            ON CONFLICT (hour, service) DO UPDATE SET orders = orders + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS client_stats_insert AFTER INSERT ON clients BEGIN
+            INSERT INTO client_stats (hour, clients)
+            VALUES (strftime('%Y-%m-%d %H:00:00', 'now'), 1)
+            ON CONFLICT (hour) DO UPDATE SET clients = clients + 1;
+        END
+    ''')
+    cursor.execute('''
+        INSERT INTO order_stats (hour, service, orders)
+        SELECT strftime('%Y-%m-%d %H:00:00', timestamp) AS hour, service, COUNT(*)
+        FROM orders WHERE timestamp IS NOT NULL
+        GROUP BY hour, service
+    ''')
+    cursor.execute('''
+        INSERT INTO client_stats (hour, clients)
+        SELECT hour, COUNT(*) FROM (
+            SELECT strftime('%Y-%m-%d %H:00:00', MIN(timestamp)) AS hour
+            FROM orders WHERE timestamp IS NOT NULL GROUP BY user_id
+        )
+        GROUP BY hour
+    ''')
+
+
+def phone_tokens_sql(expression: str) -> str:
+    """SQL-выражение для столбца phone в orders_fts: только цифры и отдельно последние 10.
+
+    Так '+7 (900) 123-45-67' и '8 900 1234567' находятся и по '7900…', и по '900…'.
+    """
+    digits = expression
+    for char in ('+', '-', ' ', '(', ')', '.'):
+        digits = f"replace({digits}, '{char}', '')"
+    return f"CASE WHEN length({digits}) > 10 THEN {digits} || ' ' || substr({digits}, -10) ELSE {digits} END"
+
+
+def create_fts_table(cursor, schema: str = 'main'):
+    """Таблица FTS5 orders_fts; в схеме архива (archive.py) — с той же настройкой токенизатора"""
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.orders_fts USING fts5(
+            username, phone, service,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+
+
+def create_search_index(cursor):
+    """Полнотекстовый индекс FTS5 по заказам: имя и телефон клиента, услуга; rowid = orders.id"""
+    create_fts_table(cursor)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS orders_fts_insert AFTER INSERT ON orders BEGIN
+            INSERT INTO orders_fts (rowid, username, phone, service)
+            SELECT NEW.id, clients.username, {phone_tokens_sql('clients.phone')}, NEW.service
+            FROM clients WHERE clients.id = NEW.user_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_fts_delete AFTER DELETE ON orders BEGIN
+            DELETE FROM orders_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_fts_update AFTER UPDATE OF service ON orders BEGIN
+            UPDATE orders_fts SET service = NEW.service WHERE rowid = NEW.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS clients_fts_update AFTER UPDATE OF username, phone ON clients BEGIN
+            UPDATE orders_fts SET username = NEW.username, phone = {phone_tokens_sql('NEW.phone')}
+            WHERE rowid IN (SELECT id FROM orders WHERE user_id = NEW.id);
+        END
+    ''')
+    cursor.execute(f'''
+        INSERT INTO orders_fts (rowid, username, phone, service)
+        SELECT orders.id, clients.username, {phone_tokens_sql('clients.phone')}, orders.service
+        FROM orders JOIN clients ON orders.user_id = clients.id
+    ''')
+    cursor.execute("INSERT INTO orders_fts (orders_fts) VALUES ('optimize')")
+
+
+def create_order_archives(cursor):
+    """Реестр помесячных архивов заказов (archive.py): месяц 'YYYY-MM' и число заказов в файле"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_archives (
+            month TEXT PRIMARY KEY,
+            orders INTEGER NOT NULL DEFAULT 0,
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+
+
+# Новые изменения схемы добавляются только в конец списка со следующим номером
+MIGRATIONS = (
+    (1, 'base tables', create_base_tables),
+    (2, 'hot query indexes', create_indexes),
+    (3, 'outbox', create_outbox),
+    (4, 'dashboard stats', create_stats),
+    (5, 'orders full-text search', create_search_index),
+    (6, 'outbox chat rate limits', add_outbox_chats),
+    (7, 'order archives', create_order_archives),
+)
+
+_migrated = set()
+_lock = threading.Lock()
+
+
+def current_version(cursor) -> int:
+    return cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(repo: repository.Repository = None) -> int:
+    """Применяет недостающие миграции; в процессе выполняется один раз на файл БД.
+
+    Всё идёт в одной транзакции BEGIN IMMEDIATE, поэтому несколько процессов,
+    стартующих одновременно, не применят одну миграцию дважды.
+    """
+    repo = repo or repository.db
+    if repo.path in _migrated:
+        return None
+    with _lock:
+        if repo.path in _migrated:
+            return None
+        with repo.transaction() as cursor:
+            cursor.execute(CREATE_SCHEMA_VERSION)
+            version = current_version(cursor)
+            for number, name, apply in MIGRATIONS:
+                if number <= version:
+                    continue
+                apply(cursor)
+                cursor.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)', (number, name))
+                logger.info(f"Применена миграция {number}: {name}")
+                version = number
+        _migrated.add(repo.path)
+        return version
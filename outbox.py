@@ -0,0 +1,293 @@
+import os
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import repository
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+# Сообщений в минуту на один чат: для групп Telegram допускает около 20; 0 — без ограничения
+OUTBOX_CHAT_RATE = float(os.getenv('OUTBOX_CHAT_RATE', '20'))
+# Максимальная длина текста сообщения в Bot API
+MESSAGE_LIMIT = 4096
+DIGEST_SEPARATOR = '\n———\n\n'
+
+CREATE_OUTBOX = '''
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id TEXT NOT NULL,
+        message TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        last_error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        sent_at DATETIME
+    )
+'''
+CREATE_OUTBOX_INDEX = 'CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)'
+# Общее для всех процессов расписание чатов: раньше next_send_at в чат ничего не отправляется
+CREATE_OUTBOX_CHATS = '''
+    CREATE TABLE IF NOT EXISTS outbox_chats (
+        chat_id TEXT PRIMARY KEY,
+        next_send_at REAL NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+'''
+# single = 1: сообщение отправляется отдельно (сводка с ним была отклонена Telegram)
+ADD_OUTBOX_SINGLE = 'ALTER TABLE outbox ADD COLUMN single INTEGER NOT NULL DEFAULT 0'
+
+INSERT_MESSAGE = 'INSERT INTO outbox (chat_id, message) VALUES (?, ?)'
+SELECT_DUE = '''
+    SELECT outbox.id, outbox.chat_id, outbox.message, outbox.attempts, outbox.single FROM outbox
+    LEFT JOIN outbox_chats ON outbox_chats.chat_id = outbox.chat_id
+    WHERE outbox.status IN ('pending', 'sending') AND outbox.next_attempt_at <= ?
+      AND COALESCE(outbox_chats.next_send_at, 0) <= ?
+    ORDER BY outbox.id
+    LIMIT ?
+'''
+SELECT_NEXT_DUE = '''
+    SELECT MIN(MAX(outbox.next_attempt_at, COALESCE(outbox_chats.next_send_at, 0))) FROM outbox
+    LEFT JOIN outbox_chats ON outbox_chats.chat_id = outbox.chat_id
+    WHERE outbox.status IN ('pending', 'sending')
+'''
+RESERVE_CHAT = '''
+    INSERT INTO outbox_chats (chat_id, next_send_at) VALUES (?, ?)
+    ON CONFLICT (chat_id) DO UPDATE SET next_send_at = MAX(next_send_at, excluded.next_send_at)
+'''
+MARK_SENDING = "UPDATE outbox SET status = 'sending', next_attempt_at = ? WHERE id = ?"
+MARK_SENT = "UPDATE outbox SET status = 'sent', attempts = ?, last_error = NULL, sent_at = CURRENT_TIMESTAMP WHERE id = ?"
+MARK_RETRY = "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?"
+MARK_FAILED = "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?"
+MARK_SINGLE = "UPDATE outbox SET status = 'pending', single = 1, next_attempt_at = 0, last_error = ? WHERE id = ?"
+
+
+def enqueue(chat_id: str, message: str) -> int:
+    """Ставит сообщение в очередь.
+
+    Внутри открытой repository.db.transaction() запись попадает в ту же транзакцию,
+    что и заказ, поэтому уведомление не теряется и не уходит для откатившегося заказа.
+    """
+    with repository.db.transaction() as cursor:
+        cursor.execute(INSERT_MESSAGE, (str(chat_id), message))
+        message_id = cursor.lastrowid
+    # Диспетчер будим после COMMIT, иначе он не увидит строку и уснёт до следующего опроса
+    repository.db.after_commit(dispatcher.wake)
+    return message_id
+
+
+def render_digest(messages: list) -> str:
+    """Текст для отправки: одно сообщение как есть, несколько — сводкой с заголовком"""
+    if len(messages) == 1:
+        return messages[0]
+    return f"<b>Уведомлений: {len(messages)}</b>\n\n" + DIGEST_SEPARATOR.join(messages)
+
+
+def build_digests(rows, limit: int = MESSAGE_LIMIT) -> list:
+    """Делит строки outbox (по id) на сводки: не больше одной на чат и не длиннее limit.
+
+    Сводка обрывается на первом не поместившемся сообщении, чтобы порядок в чате
+    сохранился; остальные уйдут следующей сводкой. Сообщения с single = 1 идут по одному.
+    """
+    digests = {}
+    closed = set()
+    for row in rows:
+        chat_id = row[1]
+        if chat_id in closed:
+            continue
+        digest = digests.setdefault(chat_id, [])
+        if digest and (row[4] or digest[0][4]
+                       or len(render_digest([r[2] for r in digest] + [row[2]])) > limit):
+            closed.add(chat_id)
+            continue
+        digest.append(row)
+    return list(digests.values())
+
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, retry_after: float = None, permanent: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+def send_to_telegram(session: requests.Session, token: str, chat_id: str, message: str, timeout: float = 10):
+    """Отправляет сообщение через Bot API; при неудаче бросает DeliveryError"""
+    started = time.perf_counter()
+    try:
+        response = session.post(
+            f'{TELEGRAM_API_URL}/bot{token}/sendMessage',
+            json={
+                'chat_id': chat_id,
+                'text': message,
+                'parse_mode': 'HTML',
+                'disable_web_page_preview': True
+            },
+            timeout=timeout
+        )
+    except requests.exceptions.RequestException as e:
+        metrics.telegram_api_duration.observe(time.perf_counter() - started, 'sendMessage')
+        metrics.telegram_api_errors.inc('sendMessage', type(e).__name__)
+        # В тексте исключения есть URL с токеном бота — в лог и в БД он попасть не должен
+        raise DeliveryError(f"Сетевая ошибка: {str(e).replace(token, '***')}")
+
+    metrics.telegram_api_duration.observe(time.perf_counter() - started, 'sendMessage')
+    if response.ok:
+        return response.json()
+
+    metrics.telegram_api_errors.inc('sendMessage', str(response.status_code))
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+    description = data.get('description', response.reason)
+    if response.status_code == 429:
+        retry_after = data.get('parameters', {}).get('retry_after')
+        raise DeliveryError(f"429: {description}", retry_after=retry_after)
+    # Остальные 4xx (неверный chat_id, разметка и т.п.) повтором не исправить
+    raise DeliveryError(f"{response.status_code}: {description}", permanent=400 <= response.status_code < 500)
+
+
+class OutboxDispatcher:
+    """Фоновый поток, доставляющий сообщения из outbox с повторами и экспоненциальной задержкой.
+
+    В каждый чат уходит не больше chat_rate сообщений в минуту: всё, что накопилось за
+    интервал, отправляется одной сводкой. Расписание чатов хранится в outbox_chats, поэтому
+    лимит соблюдается и при нескольких процессах с диспетчерами. Ответ 429 сдвигает
+    расписание чата на retry_after и не считается неудачной попыткой.
+    """
+
+    def __init__(self, batch_size: int = 100, poll_interval: float = 5.0, max_attempts: int = 8,
+                 backoff_base: float = 2.0, backoff_max: float = 600.0, timeout: float = 10.0,
+                 chat_rate: float = OUTBOX_CHAT_RATE):
+        self.batch_size = batch_size
+        self.chat_interval = 60.0 / chat_rate if chat_rate > 0 else 0.0
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.token = None
+        self.session = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, token: str):
+        """Запускает поток доставки (повторный вызов ничего не делает)"""
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self.token = token
+            self.session = requests.Session()
+            # Одно keep-alive соединение с api.telegram.org на весь процесс
+            self.session.mount(TELEGRAM_API_URL, HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0))
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='outbox-dispatcher', daemon=True)
+            self._thread.start()
+            logger.info("Диспетчер уведомлений запущен")
+
+    def stop(self, timeout: float = None):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self.session:
+            self.session.close()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        # Сайт применяет миграции при первом запросе, а диспетчер стартует раньше
+        import migrations
+        try:
+            migrations.migrate()
+        except Exception as e:
+            logger.error(f"Не удалось применить миграции: {e}", exc_info=True)
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                delivered = self.dispatch_once()
+            except Exception as e:
+                logger.error(f"Ошибка диспетчера уведомлений: {e}", exc_info=True)
+                delivered = 0
+            if not delivered:
+                self._wakeup.wait(self._idle_timeout())
+
+    def _idle_timeout(self) -> float:
+        """Сколько спать до ближайшего запланированного повтора (не дольше poll_interval)"""
+        try:
+            next_due = repository.db.fetchone(SELECT_NEXT_DUE)[0]
+        except Exception:
+            return self.poll_interval
+        if next_due is None:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, next_due - time.time()))
+
+    def _claim(self):
+        """Забирает по сводке на каждый свободный чат, помечая сообщения 'sending' с арендой"""
+        now = time.time()
+        with repository.db.transaction() as cursor:
+            rows = cursor.execute(SELECT_DUE, (now, now, self.batch_size)).fetchall()
+            digests = build_digests(rows)
+            # Если процесс упадёт во время отправки, сообщение снова станет доступно после аренды
+            lease_until = now + self.timeout * 3
+            for digest in digests:
+                cursor.executemany(MARK_SENDING, [(lease_until, row[0]) for row in digest])
+                if self.chat_interval:
+                    cursor.execute(RESERVE_CHAT, (digest[0][1], now + self.chat_interval))
+        return digests
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.backoff_max, self.backoff_base ** attempts)
+
+    def dispatch_once(self) -> int:
+        """Отправляет по сводке в каждый свободный чат; возвращает количество взятых сообщений"""
+        digests = self._claim()
+        for digest in digests:
+            self._deliver(digest)
+        return sum(len(digest) for digest in digests)
+
+    def _deliver(self, rows):
+        chat_id = rows[0][1]
+        if len(rows) == 1:
+            name = f"Уведомление #{rows[0][0]}"
+        else:
+            name = f"Сводка #{rows[0][0]}..#{rows[-1][0]} ({len(rows)} шт.)"
+        attempts = max(row[3] for row in rows) + 1
+        try:
+            send_to_telegram(self.session, self.token, chat_id, render_digest([row[2] for row in rows]), self.timeout)
+        except DeliveryError as e:
+            with repository.db.transaction() as cursor:
+                if e.retry_after is not None:
+                    # Лимит Telegram: ждёт весь чат, попытка не засчитывается
+                    retry_at = time.time() + e.retry_after
+                    logger.warning(f"{name}: {e}, чат {chat_id} ждёт {e.retry_after} с")
+                    cursor.execute(RESERVE_CHAT, (chat_id, retry_at))
+                    cursor.executemany(MARK_RETRY, [(row[3], retry_at, str(e), row[0]) for row in rows])
+                elif e.permanent and len(rows) > 1:
+                    # Отклонено одно из сообщений сводки: каждое уйдёт отдельно, остальные не потеряются
+                    logger.warning(f"{name}: {e}, сообщения будут отправлены по одному")
+                    cursor.executemany(MARK_SINGLE, [(str(e), row[0]) for row in rows])
+                elif e.permanent or attempts >= self.max_attempts:
+                    logger.error(f"{name} не доставлено: {e}")
+                    cursor.executemany(MARK_FAILED, [(attempts, str(e), row[0]) for row in rows])
+                else:
+                    delay = self._backoff(attempts)
+                    logger.warning(f"{name}: {e}, повтор через {delay} с")
+                    retry_at = time.time() + delay
+                    cursor.executemany(MARK_RETRY, [(attempts, retry_at, str(e), row[0]) for row in rows])
+        else:
+            with repository.db.transaction() as cursor:
+                cursor.executemany(MARK_SENT, [(attempts, row[0]) for row in rows])
+            metrics.outbox_sent.inc('digest' if len(rows) > 1 else 'single', amount=len(rows))
+
+
+dispatcher = OutboxDispatcher()
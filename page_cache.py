@@ -0,0 +1,83 @@
+import hashlib
+import threading
+from datetime import datetime, timezone
+from functools import wraps
+from flask import make_response, request, session
+from flask_login import current_user
+
+
+class CachedPage:
+    __slots__ = ('body', 'etag', 'last_modified', 'uptodate')
+
+    def __init__(self, body: str, uptodate):
+        self.body = body
+        self.etag = hashlib.sha1(body.encode()).hexdigest()
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self.uptodate = uptodate
+
+
+class PageCache:
+    """Кэш отрендеренных страниц, которые зависят только от шаблона и статуса авторизации.
+
+    Ключ — (endpoint, авторизован ли пользователь). Страницы с флеш-сообщениями не кэшируются.
+    Запись сбрасывается, когда меняется файл шаблона.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.hits = 0
+        self.misses = 0
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def _uptodate(self, template_name: str):
+        _, _, uptodate = self.app.jinja_env.loader.get_source(self.app.jinja_env, template_name)
+        return uptodate or (lambda: True)
+
+    def _get(self, key):
+        page = self._pages.get(key)
+        if page is not None and not page.uptodate():
+            with self._lock:
+                self._pages.pop(key, None)
+            return None
+        return page
+
+    def cached(self, template_name: str):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Флеш-сообщения показываются один раз — такую страницу не сохраняем
+                if session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                key = (request.endpoint, current_user.is_authenticated)
+                page = self._get(key)
+                if page is None:
+                    body = view(*args, **kwargs)
+                    if not isinstance(body, str):
+                        return body
+                    page = CachedPage(body, self._uptodate(template_name))
+                    with self._lock:
+                        self._pages[key] = page
+                        self.misses += 1
+                else:
+                    with self._lock:
+                        self.hits += 1
+
+                response = make_response(page.body)
+                response.set_etag(page.etag)
+                response.last_modified = page.last_modified
+                # Браузер хранит страницу, но каждый раз сверяет ETag; содержимое зависит от cookie сессии
+                response.headers['Cache-Control'] = 'private, no-cache'
+                response.vary.add('Cookie')
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._pages), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,112 @@
+import os
+import hmac
+import asyncio
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Параметры scrypt: N = 2**PASSWORD_HASH_COST, память на хэш ~ 128 * r * N байт (16 МБ при 14/8)
+PASSWORD_HASH_COST = int(os.getenv('PASSWORD_HASH_COST', '14'))
+PASSWORD_HASH_R = 8
+PASSWORD_HASH_P = 1
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def _scrypt(password: str, salt: bytes, cost: int, r: int, p: int) -> bytes:
+    n = 2 ** cost
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n, dklen=KEY_BYTES)
+
+
+def _hash(password: str, cost: int) -> str:
+    """Выполняется в потоке пула: 'scrypt$cost$r$p$salt$hash'"""
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, cost, PASSWORD_HASH_R, PASSWORD_HASH_P)
+    return f'scrypt${cost}${PASSWORD_HASH_R}${PASSWORD_HASH_P}${salt.hex()}${key.hex()}'
+
+
+def _verify(password: str, stored: str, cost: int):
+    """Выполняется в потоке пула; возвращает (пароль верен, новый хэш или None).
+
+    Новый хэш считается сразу, если сохранённый в старом формате или с другой стоимостью.
+    """
+    if stored.startswith('scrypt$'):
+        try:
+            _, stored_cost, r, p, salt, key = stored.split('$')
+            candidate = _scrypt(password, bytes.fromhex(salt), int(stored_cost), int(r), int(p))
+        except ValueError:
+            return False, None
+        ok = hmac.compare_digest(candidate.hex(), key)
+        outdated = int(stored_cost) != cost
+    else:
+        # Старый формат: несолёный SHA-256 в hex
+        ok = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+        outdated = True
+    return ok, _hash(password, cost) if ok and outdated else None
+
+
+class PasswordHasher:
+    """Хэширование паролей в ограниченном пуле потоков, чтобы не блокировать потоки Flask и цикл бота.
+
+    hashlib.scrypt отпускает GIL, поэтому потоки считают хэши параллельно на всех ядрах.
+    Пул процессов через fork здесь опасен: к первому входу в процессе уже работают потоки
+    Flask, бота и диспетчеров, и дочерний процесс может унаследовать чужую захваченную
+    блокировку OpenSSL или SQLite и зависнуть навсегда.
+    """
+
+    def __init__(self, cost: int = PASSWORD_HASH_COST, workers: int = PASSWORD_HASH_WORKERS):
+        self.cost = cost
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        # Не больше двух задач на поток в очереди: остальные вызывающие ждут здесь
+        self._slots = threading.BoundedSemaphore(workers * 2)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+                logger.info(f"Пул хэширования паролей: {self.workers} воркеров, cost={self.cost}")
+            return self._executor
+
+    def _submit(self, fn, *args):
+        self._slots.acquire()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def hash(self, password: str) -> str:
+        return self._submit(_hash, password, self.cost).result()
+
+    def verify(self, password: str, stored: str):
+        """Возвращает (пароль верен, новый хэш для сохранения или None)"""
+        return self._submit(_verify, password, stored, self.cost).result()
+
+    async def hash_async(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        # Ожидание свободного слота тоже не должно блокировать цикл событий
+        future = await loop.run_in_executor(None, self._submit, _hash, password, self.cost)
+        return await asyncio.wrap_future(future)
+
+    async def verify_async(self, password: str, stored: str):
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(None, self._submit, _verify, password, stored, self.cost)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,217 @@
+import os
+import sys
+import time
+import marshal
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Если задано при старте, tracemalloc включается сразу (например, чтобы видеть аллокации импорта)
+TRACEMALLOC_FRAMES = int(os.getenv('TRACEMALLOC_FRAMES', '0'))
+
+MAX_PROFILE_SECONDS = 60
+MIN_INTERVAL = 0.001
+# Функции на вершине стека, означающие, что поток ждёт (блокировку, сокет, очередь), а не работает
+IDLE_FUNCTIONS = {'wait', 'select', 'poll', 'accept', 'readinto', 'recv_into', '_wait_for_tstate_lock'}
+
+
+class MemoryTracer:
+    """Включение tracemalloc по запросу и сравнение снимков с базовым"""
+
+    def __init__(self):
+        self.baseline = None
+        self._lock = threading.Lock()
+
+    def status(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'tracing': tracemalloc.is_tracing(),
+            'frames': tracemalloc.get_traceback_limit(),
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'overhead_bytes': tracemalloc.get_tracemalloc_memory(),
+            'baseline': self.baseline is not None,
+        }
+
+    def start(self, frames: int = 1):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, frames))
+                logger.info(f"tracemalloc включён ({frames} кадров)")
+
+    def stop(self):
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.info("tracemalloc выключен")
+            self.baseline = None
+
+    def take_baseline(self):
+        """Базовый снимок, с которым сравнивает diff()"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc не запущен")
+        with self._lock:
+            self.baseline = tracemalloc.take_snapshot()
+
+    def diff(self, top: int = 20, key_type: str = 'lineno') -> list:
+        """Top N мест аллокации по приросту памяти с момента базового снимка"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc не запущен")
+        if self.baseline is None:
+            raise RuntimeError("Сначала сделайте базовый снимок")
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(self.baseline, key_type)
+        return [
+            {
+                'location': str(stat.traceback[0]) if stat.traceback else '?',
+                'traceback': stat.traceback.format(),
+                'size_diff': stat.size_diff,
+                'size': stat.size,
+                'count_diff': stat.count_diff,
+                'count': stat.count,
+            }
+            for stat in stats[:top]
+        ]
+
+
+def frame_key(frame):
+    """Ключ функции как в pstats: (файл, первая строка, имя)"""
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик всех потоков процесса через sys._current_frames().
+
+    Раз в interval секунд запоминает стеки потоков; накладные расходы не зависят от числа
+    вызовов в профилируемом коде. Одновременно работает только один профиль.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def run(self, seconds: float, interval: float = 0.005, include_idle: bool = False):
+        """Собирает стеки в течение seconds; возвращает (Counter стеков, фактический интервал).
+
+        По умолчанию ждущие потоки (см. IDLE_FUNCTIONS) не учитываются.
+        """
+        seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+        interval = max(interval, MIN_INTERVAL)
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже идёт")
+        try:
+            me = threading.get_ident()
+            names = {}
+            stacks = Counter()
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me or (not include_idle and frame.f_code.co_name in IDLE_FUNCTIONS):
+                        continue
+                    if thread_id not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    stack = []
+                    while frame is not None:
+                        stack.append(frame_key(frame))
+                        frame = frame.f_back
+                    stack.append(('', 0, f'thread:{names.get(thread_id, thread_id)}'))
+                    stacks[tuple(reversed(stack))] += 1
+                samples += 1
+                time.sleep(interval)
+            elapsed = time.perf_counter() - started
+            return stacks, elapsed / max(samples, 1)
+        finally:
+            self._lock.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    """Формат 'a;b;c N' для flamegraph.pl, speedscope и inferno"""
+    lines = []
+    for stack, count in stacks.most_common():
+        frames = ';'.join(name if not filename else f'{name} ({os.path.basename(filename)}:{line})'
+                          for filename, line, name in stack)
+        lines.append(f'{frames} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def pstats_dump(stacks: Counter, interval: float) -> bytes:
+    """Сэмплы в формате файла pstats (marshal), который читают pstats.Stats и snakeviz.
+
+    Время функции — число сэмплов, где она на вершине стека (tt) или в стеке вообще (ct),
+    умноженное на интервал сэмплирования.
+    """
+    stats = {}
+
+    def entry(key):
+        if key not in stats:
+            stats[key] = [0, 0, 0.0, 0.0, {}]
+        return stats[key]
+
+    for stack, count in stacks.items():
+        duration = count * interval
+        entry(stack[-1])[2] += duration
+        seen = set()
+        for index, key in enumerate(stack):
+            item = entry(key)
+            if key not in seen:
+                item[3] += duration
+                item[0] += count
+                item[1] += count
+                seen.add(key)
+            if index:
+                caller = stack[index - 1]
+                cc, nc, tt, ct = item[4].get(caller, (0, 0, 0.0, 0.0))
+                item[4][caller] = (cc + count, nc + count, tt, ct + duration)
+    return marshal.dumps({key: (cc, nc, tt, ct, callers) for key, (cc, nc, tt, ct, callers) in stats.items()})
+
+
+class StartupProfile:
+    """Длительность фаз холодного старта (импорты и инициализация) для main.py --startup-profile.
+
+    Отсчёт идёт от импорта этого модуля — первого в main.py. Отложенные фазы (бот,
+    первый запрос) записываются, когда до них доходит дело.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name: str):
+        modules = len(sys.modules)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({
+                'phase': name,
+                'start_ms': round((started - self.started) * 1000, 1),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+                'new_modules': len(sys.modules) - modules,
+            })
+
+    def summary(self) -> str:
+        return ', '.join(f"{phase['phase']} {phase['duration_ms']} мс" for phase in self.phases)
+
+    def report(self) -> dict:
+        return {
+            'elapsed_ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'modules': len(sys.modules),
+            'phases': list(self.phases),
+        }
+
+
+memory_tracer = MemoryTracer()
+cpu_profiler = SamplingProfiler()
+startup = StartupProfile()
+
+
+def start_from_env():
+    if TRACEMALLOC_FRAMES:
+        memory_tracer.start(TRACEMALLOC_FRAMES)
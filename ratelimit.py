@@ -0,0 +1,123 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Лимиты по умолчанию: (запросов, за секунд) — столько можно сделать разом, дальше с этой скоростью
+DEFAULT_LIMITS = {
+    'register': (5, 600),     # регистраций с одного IP
+    'login': (10, 300),       # попыток входа с одного IP
+    'order': (10, 600),       # заказов с сайта с одного IP
+    'admin_login': (5, 300),  # попыток ввести пароль администратора с одного IP
+    'bot': (30, 60),          # сообщений боту из одного чата
+}
+# Переопределение из окружения: "login=20/300,bot=60/60"
+RATE_LIMITS = os.getenv('RATE_LIMITS', '')
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# Сколько ключей (IP или чатов) помнит каждый лимит; при переполнении вытесняются самые давние
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '10000'))
+# Сколько самых давних записей проверять на истечение при каждом обращении
+EXPIRE_PER_HIT = 2
+
+
+class TokenBucketLimiter:
+    """Корзины токенов по ключам в LRU-словаре фиксированного размера.
+
+    Корзина хранится как (токены, время последнего обращения) и пополняется при обращении.
+    Полная корзина ничем не отличается от отсутствующей, поэтому такие записи удаляются
+    лениво: при каждом обращении проверяются самые давние. Если словарь всё равно
+    заполнен, вытесняется самый давний ключ — даже если он ещё ограничен (счётчик evicted).
+    Лимиты действуют в пределах процесса: при нескольких воркерах — на каждый отдельно.
+    """
+
+    def __init__(self, name: str, count: int, period: float, maxsize: int = RATE_LIMIT_MAX_KEYS):
+        self.name = name
+        self.capacity = float(count)
+        self.period = period
+        self.rate = count / period
+        self.maxsize = maxsize
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _is_full(self, entry, now: float) -> bool:
+        tokens, stamp = entry
+        return tokens + (now - stamp) * self.rate >= self.capacity
+
+    def hit(self, key) -> float:
+        """Списывает токен; 0 — запрос разрешён, иначе сколько секунд ждать следующего токена"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.pop(key, None)
+            if entry is None:
+                tokens = self.capacity
+            else:
+                tokens = min(self.capacity, entry[0] + (now - entry[1]) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+
+            for _ in range(EXPIRE_PER_HIT):
+                oldest = next(iter(self._buckets))
+                if oldest == key or not self._is_full(self._buckets[oldest], now):
+                    break
+                del self._buckets[oldest]
+            while len(self._buckets) > self.maxsize:
+                _, entry = self._buckets.popitem(last=False)
+                if not self._is_full(entry, now):
+                    self.evicted += 1
+
+        if wait:
+            metrics.rate_limited.inc(self.name)
+        return wait
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'limit': f'{int(self.capacity)}/{self.period:g}s',
+                'keys': len(self._buckets),
+                'maxsize': self.maxsize,
+                'allowed': self.allowed,
+                'rejected': self.rejected,
+                'evicted': self.evicted,
+            }
+
+
+def parse_limits(spec: str) -> dict:
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        try:
+            name, value = item.split('=', 1)
+            count, period = value.split('/', 1)
+            limits[name.strip()] = (int(count), float(period))
+        except ValueError:
+            logger.error(f"Неверный лимит в RATE_LIMITS: {item!r}, ожидается имя=запросов/секунд")
+    return limits
+
+
+limiters = {
+    name: TokenBucketLimiter(name, count, period)
+    for name, (count, period) in parse_limits(RATE_LIMITS).items()
+}
+
+
+def hit(name: str, key) -> float:
+    """Обращение к лимиту name от ключа key (IP, chat id); 0 — разрешено"""
+    if not RATE_LIMIT_ENABLED:
+        return 0.0
+    return limiters[name].hit(key)
+
+
+def stats() -> dict:
+    return {name: limiter.stats() for name, limiter in limiters.items()}
@@ -0,0 +1,629 @@
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial
+from cache import TTLCache
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Путь к базе данных (можно переопределить для тестовых прогонов и бенчмарков)
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'orders.db')
+
+# Кэш клиентов для Flask-Login: id -> (id, username, phone)
+CLIENT_CACHE_SIZE = int(os.getenv('CLIENT_CACHE_SIZE', '10000'))
+CLIENT_CACHE_TTL = float(os.getenv('CLIENT_CACHE_TTL', '300'))
+
+# Групповая фиксация заказов: сколько ждущих записей фиксировать одной транзакцией
+ORDER_BATCH_SIZE = int(os.getenv('ORDER_BATCH_SIZE', '64'))
+
+# Архив старых заказов (archive.py): файлы ARCHIVE_DIR/orders-YYYY-MM.db, подключаемые через ATTACH
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(DATABASE_PATH)), 'archive')
+# Сколько архивов держать подключёнными к одному соединению (SQLite по умолчанию допускает 10)
+MAX_ATTACHED = 8
+
+# Размер кэша подготовленных выражений на одно соединение
+CACHED_STATEMENTS = 256
+
+# Настройки SQLite, применяемые к каждому новому соединению
+PRAGMAS = (
+    ('journal_mode', 'WAL'),       # читатели не блокируют писателя
+    ('synchronous', 'NORMAL'),     # в режиме WAL безопасно и без fsync на каждый коммит
+    ('busy_timeout', 5000),        # ждём блокировку до 5 с вместо мгновенного "database is locked"
+    ('mmap_size', 64 * 1024 * 1024),
+    ('cache_size', -16000),        # ~16 МБ страничного кэша
+    ('temp_store', 'MEMORY'),
+)
+
+# Запросы держим константами: sqlite3 кэширует подготовленные выражения по тексту SQL
+SELECT_CLIENT_BY_ID = 'SELECT id, username, phone FROM clients WHERE id = ?'
+SELECT_CLIENT_BY_USERNAME = 'SELECT id, username, password, phone FROM clients WHERE username = ?'
+SELECT_CLIENT_ID_BY_USERNAME_OR_PHONE = 'SELECT id FROM clients WHERE username = ? OR phone = ?'
+INSERT_CLIENT = 'INSERT INTO clients (username, password, phone) VALUES (?, ?, ?)'
+UPDATE_CLIENT_PASSWORD = 'UPDATE clients SET password = ? WHERE id = ?'
+INSERT_ORDER = 'INSERT INTO orders (user_id, service) VALUES (?, ?)'
+# Запросы к заказам с {schema}: 'main' — горячая таблица, иначе имя подключённого архива
+ORDERS_QUERY = '''
+    SELECT orders.id, clients.username, clients.phone, orders.service,
+           DATETIME(orders.timestamp, 'localtime') AS local_timestamp
+    FROM {schema}.orders AS orders
+    JOIN main.clients AS clients ON orders.user_id = clients.id
+'''
+# Для админки время форматируется прямо в SQL со сдвигом часового пояса (модификатор вида '+180 minutes')
+SELECT_ORDERS_PAGE = '''
+    SELECT orders.id, clients.username, clients.phone, orders.service,
+           COALESCE(strftime('%d.%m.%Y %H:%M:%S', orders.timestamp, ?), 'Нет данных') AS local_timestamp,
+           orders.timestamp
+    FROM {schema}.orders AS orders
+    JOIN main.clients AS clients ON orders.user_id = clients.id
+'''
+# Сводки дашборда: часовые корзины (UTC) сворачиваются в дни со сдвигом часового пояса
+SELECT_ORDER_STATS = '''
+    SELECT date(hour, ?) AS day, service, SUM(orders)
+    FROM order_stats
+    WHERE hour >= ? AND hour < ?
+    GROUP BY day, service
+    HAVING SUM(orders) > 0
+    ORDER BY day DESC, service
+'''
+SELECT_CLIENT_STATS = '''
+    SELECT date(hour, ?) AS day, SUM(clients)
+    FROM client_stats
+    WHERE hour >= ? AND hour < ?
+    GROUP BY day
+    ORDER BY day DESC
+'''
+# Поиск начинается с индекса orders_fts (rowid = orders.id), а не с таблицы заказов
+SELECT_ORDERS_SEARCH = '''
+    SELECT orders.id, clients.username, clients.phone, orders.service,
+           COALESCE(strftime('%d.%m.%Y %H:%M:%S', orders.timestamp, ?), 'Нет данных') AS local_timestamp,
+           orders.timestamp
+    FROM {schema}.orders_fts AS orders_fts
+    JOIN {schema}.orders AS orders ON orders.id = orders_fts.rowid
+    JOIN main.clients AS clients ON orders.user_id = clients.id
+'''
+SELECT_ARCHIVE_MONTHS = 'SELECT month FROM order_archives WHERE month >= ? AND month <= ? ORDER BY month DESC'
+
+
+def statement_label(sql: str, _labels={}) -> str:
+    """Метка SQL для метрик: текст в одну строку; для одного и того же SQL считается один раз"""
+    label = _labels.get(sql)
+    if label is None:
+        label = ' '.join(sql.split())[:160]
+        if len(_labels) < 1000:
+            _labels[sql] = label
+    return label
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, который пишет время каждого execute в sqlite_statement_duration_seconds"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.sqlite_statement_duration.observe(time.perf_counter() - started, statement_label(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.sqlite_statement_duration.observe(time.perf_counter() - started, statement_label(sql))
+
+
+class TimedConnection(sqlite3.Connection):
+    # Connection.execute из C не вызывает переопределённый cursor(), поэтому переопределяем оба
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class Repository:
+    """Доступ к SQLite с отдельным долгоживущим соединением на каждый поток"""
+
+    def __init__(self, path: str = DATABASE_PATH):
+        self.path = path
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _after_fork(self):
+        """В дочернем процессе (prefork) соединения родителя не используются и не закрываются:
+        SQLite запрещает переносить открытое соединение через fork()"""
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,  # транзакциями управляем сами через transaction()
+            cached_statements=CACHED_STATEMENTS,
+            factory=TimedConnection
+        )
+        for name, value in PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        logger.debug(f"Открыто соединение с {self.path} для потока {threading.current_thread().name}")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока, создавая его при первом обращении"""
+        if self._pid != os.getpid():
+            self._after_fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+            self._local.attached = OrderedDict()
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self, mode: str = 'IMMEDIATE'):
+        """Пишущая транзакция (BEGIN IMMEDIATE); вложенные вызовы входят во внешнюю.
+
+        mode='DEFERRED' берёт блокировку на запись только у тех файлов, в которые пишет,
+        например при записи в подключённый архив с чтением из основной базы.
+        """
+        conn = self.connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn.cursor()
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn.execute(f'BEGIN {mode}')
+        self._local.depth = 1
+        self._local.after_commit = []
+        try:
+            yield conn.cursor()
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+        finally:
+            self._local.depth = 0
+            callbacks, self._local.after_commit = self._local.after_commit, []
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback):
+        """Вызывает callback после фиксации текущей транзакции (или сразу, если её нет)"""
+        if getattr(self._local, 'depth', 0):
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+
+    def attach(self, path: str, alias: str):
+        """Подключает файл к соединению текущего потока под именем alias (ATTACH, один раз).
+
+        Подключённых файлов не больше MAX_ATTACHED: давно не использованный отключается.
+        Вне транзакции: внутри неё SQLite не разрешает ATTACH и DETACH.
+        """
+        conn = self.connection()
+        attached = self._local.attached
+        if alias in attached:
+            attached.move_to_end(alias)
+            return
+        while len(attached) >= MAX_ATTACHED:
+            oldest, _ = attached.popitem(last=False)
+            conn.execute(f'DETACH DATABASE {oldest}')
+        conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+        attached[alias] = path
+
+    def execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return self.connection().execute(sql, params)
+
+    def fetchone(self, sql: str, params=()):
+        return self.execute(sql, params).fetchone()
+
+    def fetchall(self, sql: str, params=()):
+        return self.execute(sql, params).fetchall()
+
+    def close(self):
+        """Закрывает соединение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            with self._lock:
+                self._connections.remove(conn)
+            conn.close()
+            self._local.conn = None
+
+    def close_all(self):
+        """Закрывает все соединения (при остановке приложения)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class GroupCommitWriter:
+    """Объединяет одновременные записи в одну транзакцию без отдельного потока и без ожидания.
+
+    Первый пришедший писатель становится ведущим и сразу фиксирует свою запись в своём
+    потоке — одиночный заказ проходит так же быстро, как отдельная транзакция. Записи,
+    пришедшие, пока ведущий держит транзакцию, ждут в очереди; ведущий после своей записи
+    (или следующий ведущий) фиксирует их все (до max_batch) одним COMMIT. Пачки появляются,
+    только когда писатели действительно стоят в очереди.
+
+    В пачке каждая функция выполняется внутри своей точки сохранения: ошибка одной записи
+    откатывает только её, остальные фиксируются общим COMMIT. Вызывающий получает
+    результат своей функции (например, lastrowid) только после фиксации.
+    """
+
+    def __init__(self, repo: Repository, max_batch: int = ORDER_BATCH_SIZE):
+        self.repo = repo
+        self.max_batch = max(1, max_batch)
+        self.batches = 0
+        self.writes = 0
+        self._pid = os.getpid()
+        self._pending = []
+        self._leader = threading.Lock()
+        self._changed = threading.Condition(threading.Lock())
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # После fork() блокировки могли остаться захваченными потоками родителя
+            self._pid = os.getpid()
+            self._pending = []
+            self._leader = threading.Lock()
+            self._changed = threading.Condition(threading.Lock())
+
+    def write(self, fn, *args, **kwargs):
+        """Синхронная запись (для Flask): ждёт фиксации и возвращает результат fn.
+
+        Ведущий, зафиксировав свою запись, фиксирует ещё одну пачку пришедших за это
+        время: им не нужно ждать, пока проснётся поток нового ведущего.
+        """
+        self._check_fork()
+        if not self._pending and self._leader.acquire(blocking=False):
+            # Никто не пишет: запись фиксируется сразу, как отдельная транзакция
+            try:
+                with self.repo.transaction():
+                    result = fn(*args, **kwargs)
+                self.batches += 1
+                self.writes += 1
+            finally:
+                self._commit_queued()
+                self._release()
+            return result
+
+        future = Future()
+        with self._changed:
+            self._pending.append((future, partial(fn, *args, **kwargs)))
+            while not future.done():
+                if self._leader.acquire(blocking=False):
+                    break
+                self._changed.wait()
+            else:
+                return future.result()
+        try:
+            while not future.done():
+                self._commit_queued()
+            self._commit_queued()
+        finally:
+            self._release()
+        return future.result()
+
+    def _commit_queued(self):
+        if not self._pending:
+            return
+        with self._changed:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:len(batch)]
+        if batch:
+            self._commit(batch)
+
+    def _release(self):
+        self._leader.release()
+        # Писатель ставит запись в очередь раньше, чем пробует стать ведущим, поэтому либо он
+        # увидит свободную блокировку, либо мы — его запись; остальных уже разбудил _commit
+        if self._pending:
+            with self._changed:
+                self._changed.notify_all()
+
+    async def write_async(self, fn, *args, **kwargs):
+        """Асинхронная запись (для бота): ведущий не должен держать цикл событий"""
+        return await asyncio.get_running_loop().run_in_executor(None, partial(self.write, fn, *args, **kwargs))
+
+    def _commit(self, batch):
+        results = []
+        if len(batch) == 1:
+            # Одиночной записи точка сохранения не нужна: её ошибка откатит транзакцию, как
+            # при отдельном вызове, и достанется вызывающему, а не журналу
+            future, fn = batch[0]
+            try:
+                with self.repo.transaction():
+                    results.append((future, fn(), None))
+            except Exception as e:
+                results = [(future, None, e)]
+            else:
+                self.batches += 1
+                self.writes += 1
+        else:
+            try:
+                with self.repo.transaction() as cursor:
+                    for future, fn in batch:
+                        cursor.execute('SAVEPOINT batch_item')
+                        try:
+                            results.append((future, fn(), None))
+                        except Exception as e:
+                            cursor.execute('ROLLBACK TO batch_item')
+                            results.append((future, None, e))
+                        cursor.execute('RELEASE batch_item')
+            except Exception as e:
+                logger.error(f"Ошибка групповой фиксации ({len(batch)} записей): {e}", exc_info=True)
+                results = [(future, None, e) for future, _ in batch]
+            else:
+                self.batches += 1
+                self.writes += sum(1 for _, _, error in results if error is None)
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        with self._changed:
+            self._changed.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'writes': self.writes,
+            'pending': len(self._pending),
+            'avg_batch': round(self.writes / self.batches, 2) if self.batches else 0,
+        }
+
+
+# Общий экземпляр для Flask-приложения, бота и database.py
+db = Repository()
+order_writer = GroupCommitWriter(db)
+client_cache = TTLCache(maxsize=CLIENT_CACHE_SIZE, ttl=CLIENT_CACHE_TTL)
+
+
+def get_client_by_id(user_id):
+    """Клиент по ID; в БД идём только при промахе кэша"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    client = client_cache.get(user_id)
+    if client is None:
+        client = db.fetchone(SELECT_CLIENT_BY_ID, (user_id,))
+        if client:
+            client_cache.set(user_id, client)
+    return client
+
+
+def invalidate_client(user_id):
+    """Сбрасывает кэш после изменения строки clients"""
+    client_cache.invalidate(int(user_id))
+
+
+def get_client_by_username(username: str):
+    return db.fetchone(SELECT_CLIENT_BY_USERNAME, (username,))
+
+
+def create_client(username: str, password_hash: str, phone: str):
+    """Создаёт клиента; возвращает None, если имя или телефон уже заняты"""
+    with db.transaction() as cursor:
+        if cursor.execute(SELECT_CLIENT_ID_BY_USERNAME_OR_PHONE, (username, phone)).fetchone():
+            return None
+        cursor.execute(INSERT_CLIENT, (username, password_hash, phone))
+        return cursor.lastrowid
+
+
+def get_or_create_client(username: str, password_hash: str, phone: str) -> int:
+    """Возвращает ID существующего клиента или регистрирует нового"""
+    with db.transaction() as cursor:
+        if existing := cursor.execute(SELECT_CLIENT_ID_BY_USERNAME_OR_PHONE, (username, phone)).fetchone():
+            return existing[0]
+        cursor.execute(INSERT_CLIENT, (username, password_hash, phone))
+        return cursor.lastrowid
+
+
+def update_client_password(user_id, password_hash: str):
+    with db.transaction() as cursor:
+        cursor.execute(UPDATE_CLIENT_PASSWORD, (password_hash, user_id))
+    invalidate_client(user_id)
+
+
+def save_order(user_id, service: str) -> int:
+    """Сохраняет заказ и возвращает его ID"""
+    with db.transaction() as cursor:
+        cursor.execute(INSERT_ORDER, (user_id, service))
+        return cursor.lastrowid
+
+
+def archive_alias(month: str) -> str:
+    return 'archive_' + month.replace('-', '_')
+
+
+def archive_path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f'orders-{month}.db')
+
+
+def archive_months(start: str = None, end: str = None) -> list:
+    """Месяцы ('YYYY-MM') архива, пересекающиеся с [start, end), от новых к старым"""
+    low = start[:7] if start else '0000-00'
+    high = end[:7] if end else '9999-99'
+    return [row[0] for row in db.fetchall(SELECT_ARCHIVE_MONTHS, (low, high))]
+
+
+def order_sources(start: str = None, end: str = None):
+    """Схемы с заказами за [start, end): горячая таблица, затем архивы от новых к старым.
+
+    В архив уходят только заказы старше всех оставшихся в orders, а месяцы не пересекаются,
+    поэтому запрос с ORDER BY timestamp (или id) DESC можно выполнить по схемам по очереди —
+    как UNION ALL — и остановиться, набрав LIMIT. Архивы подключаются лениво: реестр читается
+    и файлы подключаются, только если строк горячей таблицы не хватило.
+    """
+    yield 'main'
+    for month in archive_months(start, end):
+        path = archive_path(month)
+        if not os.path.exists(path):
+            logger.error(f"Файл архива {path} не найден, заказы за {month} пропущены")
+            continue
+        alias = archive_alias(month)
+        db.attach(path, alias)
+        yield alias
+
+
+def iter_orders(start: str = None, end: str = None, chunk_size: int = 1000):
+    """Построчно отдаёт заказы (новые первыми) для выгрузки, читая курсор пачками по chunk_size.
+
+    Память не зависит от размера таблицы; start/end — как в get_orders_page.
+    Заказы из архива отдаются после горячих, если период до них доходит.
+    """
+    clauses, params = [], []
+    if start:
+        clauses.append('orders.timestamp >= ?')
+        params.append(start)
+    if end:
+        clauses.append('orders.timestamp < ?')
+        params.append(end)
+
+    where = ' WHERE ' + ' AND '.join(clauses + ['orders.timestamp IS NOT NULL'])
+
+    def queries():
+        # Архивы подключаются по одному, по мере выгрузки
+        for schema in order_sources(start, end):
+            yield ORDERS_QUERY.format(schema=schema) + where + ' ORDER BY orders.timestamp DESC', params
+        if not (start or end):
+            # Заказы без даты — после всех, включая архив (как в get_orders_page)
+            yield ORDERS_QUERY.format(schema='main') + ' WHERE orders.timestamp IS NULL ORDER BY orders.id DESC', ()
+
+    for sql, sql_params in queries():
+        # Курсор закрывается до перехода к следующему архиву: открытый курсор мешает DETACH
+        cursor = db.execute(sql, sql_params)
+        try:
+            while rows := cursor.fetchmany(chunk_size):
+                yield from rows
+        finally:
+            cursor.close()
+
+
+def get_stats(start: str, end: str, tz_modifier: str = '+0 minutes') -> dict:
+    """Заказы по услугам и новые клиенты по дням за [start, end) (UTC); стоимость O(дней), а не O(заказов)"""
+    days = {}
+    for day, service, orders in db.fetchall(SELECT_ORDER_STATS, (tz_modifier, start, end)):
+        days.setdefault(day, {'orders': {}, 'new_clients': 0})['orders'][service] = orders
+    for day, clients in db.fetchall(SELECT_CLIENT_STATS, (tz_modifier, start, end)):
+        days.setdefault(day, {'orders': {}, 'new_clients': 0})['new_clients'] = clients
+    return dict(sorted(days.items(), reverse=True))
+
+
+PHONE_QUERY = re.compile(r'[\d\s()+\-.]+')
+
+
+def search_query(text: str):
+    """Строка поиска админки -> запрос FTS5 с поиском по префиксу; None, если искать нечего.
+
+    Похожий на телефон ввод сводится к цифрам; номер из 11+ цифр ищется по последним 10,
+    чтобы +7… и 8… находили одного клиента.
+    """
+    text = (text or '').strip()
+    if PHONE_QUERY.fullmatch(text):
+        digits = re.sub(r'\D', '', text)
+        tokens = [digits[-10:] if len(digits) > 10 else digits] if digits else []
+    else:
+        tokens = re.findall(r'\w+', text.lower())
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def get_orders_page(limit: int, after=None, service: str = None, start: str = None, end: str = None,
+                    tz_modifier: str = '+0 minutes', search: str = None):
+    """Страница заказов от новых к старым с keyset-пагинацией.
+
+    after — курсор (timestamp, id) последней строки предыдущей страницы; timestamp = '' —
+    курсор в хвосте старых заказов без даты (timestamp IS NULL), они идут последними по id;
+    start/end — границы по orders.timestamp (UTC, 'YYYY-MM-DD HH:MM:SS'), end не включается;
+    search — строка поиска по имени, телефону и услуге (индекс orders_fts).
+    Если горячих заказов на страницу не хватает, она дополняется из архивов периода.
+    Возвращает (строки, курсор следующей страницы или None).
+    """
+    clauses, params = [], []
+    search_text = search_query(search)
+    if search_text:
+        clauses.append('orders_fts MATCH ?')
+        params.append(search_text)
+    if service:
+        clauses.append('orders.service = ?')
+        params.append(service)
+    if start:
+        clauses.append('orders.timestamp >= ?')
+        params.append(start)
+    if end:
+        clauses.append('orders.timestamp < ?')
+        params.append(end)
+    # Заказы без даты (старые строки бота) не попадают ни в один период и идут после всех
+    # остальных, включая архив; курсор в этом хвосте — ('', id)
+    sql = SELECT_ORDERS_SEARCH if search_text else SELECT_ORDERS_PAGE
+    null_tail = not (start or end)
+    in_null_tail = null_tail and after is not None and not after[0]
+    null_clauses, null_params = clauses + ['orders.timestamp IS NULL'], list(params)
+    if in_null_tail:
+        null_clauses.append('orders.id < ?')
+        null_params.append(after[1])
+    null_sql = sql + ' WHERE ' + ' AND '.join(null_clauses) + ' ORDER BY orders.id DESC LIMIT ?'
+
+    if after and after[0]:
+        timestamp, order_id = after
+        if search_text:
+            clauses.append('orders_fts.rowid < ?')
+            params.append(order_id)
+        else:
+            clauses.append('orders.timestamp <= ? AND (orders.timestamp < ? OR orders.id < ?)')
+            params.extend((timestamp, timestamp, order_id))
+    clauses.append('orders.timestamp IS NOT NULL')
+
+    sql += ' WHERE ' + ' AND '.join(clauses)
+    if search_text:
+        # FTS5 сам отдаёт rowid по убыванию, и LIMIT останавливает поиск на первой странице;
+        # id заказов растут вместе со временем создания, так что порядок тот же
+        sql += ' ORDER BY orders_fts.rowid DESC LIMIT ?'
+    else:
+        sql += ' ORDER BY orders.timestamp DESC, orders.id DESC LIMIT ?'
+
+    # Месяцы новее курсора следующей страницы уже пройдены
+    upper = end
+    if after and after[0] and (upper is None or after[0] < upper):
+        upper = after[0]
+    rows = []
+    if not in_null_tail:
+        for schema in order_sources(start, upper):
+            rows += db.fetchall(sql.format(schema=schema), [tz_modifier, *params, limit + 1 - len(rows)])
+            if len(rows) > limit:
+                break
+    if null_tail and len(rows) <= limit:
+        rows += db.fetchall(null_sql.format(schema='main'), [tz_modifier, *null_params, limit + 1 - len(rows)])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][5] or '', rows[-1][0])
+    return rows, next_cursor
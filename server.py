@@ -0,0 +1,103 @@
+"""
+Продакшен-запуск: ровно один процесс бота и N пре-форкнутых WSGI-воркеров gunicorn.
+
+    python server.py
+
+Этот процесс запускает бота (webhook при IS_RENDER=true, иначе polling) и gunicorn с
+воркерами из gunicorn.conf.py (число — WEB_CONCURRENCY, по умолчанию по ядру). Воркеры
+принимают /webhook и пересылают тело в приёмник бота на 127.0.0.1:WEBHOOK_PORT.
+Если остановится бот или gunicorn, процесс завершается целиком, и платформа его перезапустит.
+
+main.py остаётся режимом разработки: сервер Werkzeug и бот в одном процессе.
+"""
+import os
+import sys
+import signal
+import logging
+import threading
+import subprocess
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+IS_RENDER = os.getenv('IS_RENDER', 'false').lower() == 'true'
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+RENDER_HOSTNAME = os.getenv('RENDER_EXTERNAL_HOSTNAME')
+PORT = int(os.getenv('PORT', '5000'))
+
+# Приёмник вебхуков бота слушает только локальный интерфейс: снаружи доступен лишь gunicorn
+os.environ.setdefault('WEBHOOK_HOST', '127.0.0.1')
+os.environ.setdefault('WEBHOOK_PORT', '8443')
+os.environ['BOT_FORWARD_URL'] = f"http://127.0.0.1:{os.environ['WEBHOOK_PORT']}/webhook"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Сколько ждать gunicorn после SIGTERM (его graceful_timeout плюс запас)
+SHUTDOWN_TIMEOUT = 35
+
+
+def start_bot() -> threading.Thread:
+    """Бот в потоке этого процесса"""
+    import telegram_bot
+
+    if IS_RENDER:
+        target = lambda: telegram_bot.bot_manager.run_webhook(RENDER_HOSTNAME, PORT, WEBHOOK_SECRET)  # noqa: E731
+    else:
+        target = telegram_bot.run_polling
+    thread = threading.Thread(target=target, name='bot', daemon=True)
+    thread.start()
+    return thread
+
+
+def start_web_workers() -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BASE_DIR, 'gunicorn.conf.py'), 'wsgi:app'],
+        cwd=BASE_DIR
+    )
+
+
+def main() -> int:
+    stopping = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stopping.set())
+
+    # Схема применяется здесь один раз, до старта воркеров: их первые запросы не ждут миграций
+    import migrations
+    migrations.migrate()
+
+    bot = start_bot()
+    web = start_web_workers()
+    # Перенос старых заказов в архив — только здесь, а не в каждом воркере
+    import archive
+    archive.archiver.start()
+    logger.info(f"Запущены бот ({'webhook' if IS_RENDER else 'polling'}) и gunicorn (pid {web.pid})")
+
+    code = 0
+    while not stopping.wait(1):
+        if web.poll() is not None:
+            logger.error(f"gunicorn завершился с кодом {web.returncode}")
+            return web.returncode or 1
+        if not bot.is_alive():
+            logger.error("Бот остановился")
+            code = 1
+            break
+
+    logger.info("Остановка")
+    web.terminate()
+    try:
+        web.wait(SHUTDOWN_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        web.kill()
+    import outbox
+    outbox.dispatcher.stop(5)
+    archive.archiver.stop(5)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,23 @@
 import asyncio
-import hashlib
-import requests
 import sqlite3
 import logging
 import os
+import repository
+import metrics
+import migrations
+import outbox
+import passwords
+import ratelimit
+from update_processor import ShardedUpdateProcessor
+from webhook_server import WebhookReceiver, decode_update
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
-    ApplicationBuilder, CommandHandler, MessageHandler, filters,
-    ConversationHandler, ContextTypes
+    ApplicationBuilder, CommandHandler, MessageHandler, TypeHandler, filters,
+    ConversationHandler, ContextTypes, ApplicationHandlerStop
 )
 from dotenv import load_dotenv
 from threading import Thread
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 
 # Настройка логгирования
 logging.basicConfig(
@@ -30,6 +36,15 @@ TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
     raise ValueError("Не заданы TELEGRAM_BOT_TOKEN или TELEGRAM_CHAT_ID")
 
+# Параллельная обработка обновлений: число шардов и размеры очередей
+BOT_UPDATE_WORKERS = int(os.getenv('BOT_UPDATE_WORKERS', '8'))
+BOT_SHARD_QUEUE_SIZE = int(os.getenv('BOT_SHARD_QUEUE_SIZE', '100'))
+BOT_UPDATE_QUEUE_SIZE = int(os.getenv('BOT_UPDATE_QUEUE_SIZE', '1000'))
+
+# Порт отдельного асинхронного приёмника вебхуков (если не задан, вебхуки принимает Flask)
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = os.getenv('WEBHOOK_PORT')
+
 SERVICES = {
     "🛢️ Замена масла": "oil_change",
     "⛓️ Регулировка цепи": "chain_adjustment",
@@ -52,81 +67,45 @@ services_keyboard = ReplyKeyboardMarkup(
 class BotManager:
     def __init__(self):
         self.application = None
+        self.update_processor = None
+        self.webhook_receiver = None
+        # Обновления, принятые с ответом 200, но не поместившиеся в update_queue (в порядке прихода)
+        self._overflow = deque()
         self.loop = asyncio.new_event_loop()
-        self.executor = ThreadPoolExecutor(max_workers=1)
-        self._init_db()
-
-    def _init_db(self):
-        """Инициализация базы данных"""
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS clients (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL,
-                    phone TEXT NOT NULL,
-                    password TEXT NOT NULL,
-                    UNIQUE(username, phone)
-                )''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    service TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY(user_id) REFERENCES clients(id)
-                )''')
-            conn.commit()
-
-    def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
-
-    def register_or_get_client(self, username: str, phone: str, password: str) -> int:
-        """Регистрирует нового клиента или возвращает существующего"""
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT id FROM clients WHERE username = ? OR phone = ?',
-                (username, phone)
-            )
-            if existing := cursor.fetchone():
-                return existing[0]
 
-            cursor.execute(
-                'INSERT INTO clients (username, phone, password) VALUES (?, ?, ?)',
-                (username, phone, self.hash_password(password))
-            )
-            conn.commit()
-            return cursor.lastrowid
+    async def hash_password(self, password: str) -> str:
+        """Хэширует пароль в пуле потоков, не блокируя цикл событий"""
+        return await passwords.hasher.hash_async(password)
+
+    def register_or_get_client(self, username: str, phone: str, password_hash: str) -> int:
+        """Регистрирует нового клиента или возвращает существующего"""
+        return repository.get_or_create_client(username, password_hash, phone)
 
     def save_order_to_db(self, user_id: int, service: str) -> int:
         """Сохраняет заказ в БД и возвращает его ID"""
-        with sqlite3.connect('orders.db') as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'INSERT INTO orders (user_id, service) VALUES (?, ?)',
-                (user_id, service)
-            )
-            conn.commit()
-            return cursor.lastrowid
+        return repository.save_order(user_id, service)
 
-    def send_to_telegram(self, chat_id: str, message: str):
-        """Отправляет сообщение в Telegram"""
-        try:
-            response = requests.post(
-                f'https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage',
-                json={
-                    'chat_id': chat_id,
-                    'text': message,
-                    'parse_mode': 'HTML',
-                    'disable_web_page_preview': True
-                },
-                timeout=5
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ошибка отправки в Telegram: {e}")
+    def send_to_telegram(self, chat_id: str, message: str) -> int:
+        """Ставит сообщение в очередь outbox; доставкой занимается фоновый диспетчер"""
+        return outbox.enqueue(chat_id, message)
+
+    def place_order(self, username: str, phone: str, password_hash: str, service: str) -> int:
+        """Клиент, заказ и уведомление администратору — одна транзакция; возвращает ID заказа.
+
+        Выполняется через repository.order_writer: при очереди — в потоке другого писателя,
+        в общей транзакции с другими заказами пачки.
+        """
+        with repository.db.transaction():
+            user_id = self.register_or_get_client(username, phone, password_hash)
+            order_id = self.save_order_to_db(user_id, service)
+            self.send_to_telegram(TELEGRAM_CHAT_ID, (
+                f"<b>Новый заказ!</b>\n\n"
+                f"<b>ID заказа:</b> {order_id}\n"
+                f"<b>Услуга:</b> {service}\n"
+                f"<b>Имя:</b> {username}\n"
+                f"<b>Телефон:</b> {phone}\n"
+            ))
+        return order_id
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -175,8 +154,15 @@ class BotManager:
             if not all([username, phone, service]):
                 raise ValueError("Недостаточно данных для оформления заказа")
 
-            user_id = self.register_or_get_client(username, phone, password)
-            order_id = self.save_order_to_db(user_id, service)
+            password_hash = await self.hash_password(password)
+            # Схема применяется при первом заказе, а не при создании бота; дальше это проверка множества.
+            # Не внутри place_order: там уже открыта общая транзакция пачки order_writer
+            await asyncio.get_running_loop().run_in_executor(None, migrations.migrate)
+
+            order_id = await repository.order_writer.write_async(
+                self.place_order, username, phone, password_hash, service
+            )
+            metrics.orders_created.inc(service, 'bot')
             logger.info(f"Создан заказ #{order_id} для пользователя {username}")
 
             await update.message.reply_text(
@@ -186,15 +172,6 @@ class BotManager:
                 reply_markup=start_keyboard
             )
 
-            admin_msg = (
-                f"<b>Новый заказ!</b>\n\n"
-                f"<b>ID заказа:</b> {order_id}\n"
-                f"<b>Услуга:</b> {service}\n"
-                f"<b>Имя:</b> {username}\n"
-                f"<b>Телефон:</b> {phone}\n"
-            )
-            self.send_to_telegram(TELEGRAM_CHAT_ID, admin_msg)
-
         except sqlite3.Error as e:
             logger.error(f"Ошибка базы данных: {e}")
             await update.message.reply_text(
@@ -218,6 +195,13 @@ class BotManager:
         )
         return ConversationHandler.END
 
+    async def throttle(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ограничение частоты по чату: лишние обновления молча отбрасываются до диалога"""
+        chat = update.effective_chat
+        if chat and ratelimit.hit('bot', chat.id):
+            logger.debug(f"Превышен лимит сообщений для чата {chat.id}")
+            raise ApplicationHandlerStop
+
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик ошибок"""
         logger.error(f"Ошибка: {context.error}", exc_info=True)
@@ -229,17 +213,32 @@ class BotManager:
 
     async def post_init(self, application):
         """Функция, выполняемая после инициализации бота"""
+        outbox.dispatcher.start(TELEGRAM_BOT_TOKEN)
         logger.info("Бот успешно инициализирован")
         logger.info("База данных готова к работе")
 
-    def init_bot(self):
-        """Инициализация и настройка бота"""
-        self.application = ApplicationBuilder() \
+    def _builder(self):
+        """ApplicationBuilder с шардированной обработкой и ограниченной очередью обновлений"""
+        self.update_processor = ShardedUpdateProcessor(
+            shards=BOT_UPDATE_WORKERS,
+            shard_queue_size=BOT_SHARD_QUEUE_SIZE
+        )
+        return ApplicationBuilder() \
             .token(TELEGRAM_BOT_TOKEN) \
-            .post_init(self.post_init) \
-            .build()
-
-        # Регистрация обработчиков
+            .base_url(f'{outbox.TELEGRAM_API_URL}/bot') \
+            .base_file_url(f'{outbox.TELEGRAM_API_URL}/file/bot') \
+            .concurrent_updates(self.update_processor) \
+            .update_queue(asyncio.Queue(maxsize=BOT_UPDATE_QUEUE_SIZE))
+
+    def queue_depths(self) -> dict:
+        """Длина общей очереди обновлений и очередей шардов"""
+        return {
+            'update_queue': self.application.update_queue.qsize() if self.application else 0,
+            'shards': self.update_processor.depths() if self.update_processor else [],
+        }
+
+    def _register_handlers(self, application):
+        """Регистрация обработчиков диалога оформления заказа"""
         conv_handler = ConversationHandler(
             entry_points=[CommandHandler('start', self.start)],
             states={
@@ -251,40 +250,22 @@ class BotManager:
             fallbacks=[CommandHandler('cancel', self.cancel)]
         )
 
-        self.application.add_handler(conv_handler)
-        self.application.add_error_handler(self.error_handler)
-        return self.application
+        application.add_handler(TypeHandler(Update, self.throttle), group=-1)
+        application.add_handler(conv_handler)
+        application.add_error_handler(self.error_handler)
 
-    async def process_updates(self):
-        """Обработка обновлений из очереди"""
-        logger.info("Запуск обработчика обновлений")
-        try:
-            while True:
-                try:
-                    update = await self.application.update_queue.get()
-                    logger.info(f"Обработка обновления ID: {update.update_id}")
-
-                    await self.application.process_update(update)
-                    logger.info(f"Обновление {update.update_id} успешно обработано")
-
-                except Exception as e:
-                    logger.error(f"Ошибка обработки обновления: {str(e)}", exc_info=True)
-                    await asyncio.sleep(1)
-        except asyncio.CancelledError:
-            logger.info("Обработчик обновлений остановлен")
+    def init_bot(self):
+        """Инициализация и настройка бота"""
+        self.application = self._builder() \
+            .post_init(self.post_init) \
+            .build()
+        self._register_handlers(self.application)
+        return self.application
 
     async def _async_init(self):
         """Асинхронная инициализация бота"""
-        self.application = ApplicationBuilder() \
-            .token(TELEGRAM_BOT_TOKEN) \
-            .build()
-
-        # Регистрация обработчиков
-        conv_handler = ConversationHandler(...)
-        self.application.add_handler(conv_handler)
-
-        # Создаем очередь в текущем event loop
-        self.update_queue = asyncio.Queue()
+        self.application = self._builder().build()
+        self._register_handlers(self.application)
         return self.application
 
     def run_webhook(self, hostname: str, port: int, secret_token: str):
@@ -292,6 +273,7 @@ class BotManager:
 
         async def _run():
             app = await self._async_init()
+            outbox.dispatcher.start(TELEGRAM_BOT_TOKEN)
             await app.initialize()
             await app.start()
 
@@ -302,36 +284,67 @@ class BotManager:
                 drop_pending_updates=True
             )
 
-            # Запуск обработчика в том же loop
-            asyncio.create_task(self._process_updates(app))
+            if WEBHOOK_PORT:
+                self.webhook_receiver = WebhookReceiver(app, secret_token, WEBHOOK_HOST, int(WEBHOOK_PORT))
+                await self.webhook_receiver.start()
 
+            # Обновления из приёмника и submit_update разбирает Application через шардированный процессор
             while True:
                 await asyncio.sleep(3600)
 
         # Запуск в выделенном loop
         self.loop.run_until_complete(_run())
 
-    async def _process_updates(self, app):
-        """Обработка обновлений"""
-        while True:
+    def submit_update(self, body: bytes) -> int:
+        """Приём вебхука из другого потока (Flask): возвращает HTTP-статус без ожидания обработки"""
+        if not self.application or not self.application.running or not self.loop.is_running():
+            return 503
+        queue = self.application.update_queue
+        if queue.full() or self._overflow:
+            return 429
+        try:
+            update = decode_update(body, self.application.bot)
+        except ValueError as e:
+            logger.warning(f"Не удалось разобрать вебхук: {e!r}")
+            return 400
+        self.loop.call_soon_threadsafe(self._put_nowait, update)
+        return 200
+
+    def _put_nowait(self, update):
+        if not self._overflow:
             try:
-                update = await self.update_queue.get()
-                await app.process_update(update)
-            except Exception as e:
-                logging.error(f"Update error: {e}")
+                self.application.update_queue.put_nowait(update)
+                return
+            except asyncio.QueueFull:
+                pass
+        # Очередь заполнилась между проверкой и вставкой: 200 уже отдан, поэтому дожидаемся места.
+        # Отложенные обновления ставятся по одному и раньше следующих, иначе шаги диалога
+        # одного чата могут прийти в ConversationHandler не по порядку
+        self._overflow.append(update)
+        if len(self._overflow) == 1:
+            self.loop.create_task(self._drain_overflow())
+
+    async def _drain_overflow(self):
+        queue = self.application.update_queue
+        while self._overflow:
+            await queue.put(self._overflow[0])
+            self._overflow.popleft()
 
     def put_update(self, update):
         """Добавление обновления в очередь"""
         asyncio.run_coroutine_threadsafe(
-            self.update_queue.put(update),
+            self.application.update_queue.put(update),
             self.loop
         )
+
     async def run_polling(self):
         """Запуск бота в режиме polling"""
         if not self.application:
             self.init_bot()
 
         logger.info("Запуск бота в режиме polling")
+        # post_init вызывает только Application.run_polling, поэтому диспетчер запускаем сами
+        outbox.dispatcher.start(TELEGRAM_BOT_TOKEN)
         await self.application.initialize()
         await self.application.start()
         await self.application.updater.start_polling()
@@ -343,6 +356,15 @@ class BotManager:
 # Глобальный экземпляр для использования в Flask
 bot_manager = BotManager()
 
+metrics.Gauge(
+    'bot_update_queue_depth', 'Обновления в общей очереди Application',
+    callback=lambda: {(): bot_manager.queue_depths()['update_queue']}
+)
+metrics.Gauge(
+    'bot_shard_queue_depth', 'Обновления в очереди шарда', ('shard',),
+    callback=lambda: {(str(index),): depth for index, depth in enumerate(bot_manager.queue_depths()['shards'])}
+)
+
 
 def init_bot():
     """Инициализация бота"""
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+import metrics
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedUpdateProcessor(BaseUpdateProcessor):
+    """Обработка обновлений в N параллельных шардах с порядком внутри одного чата.
+
+    Обновления одного чата всегда попадают в один шард и обрабатываются по очереди,
+    поэтому переходы ConversationHandler не перемешиваются, а медленный диалог
+    задерживает только свой шард. Очереди шардов ограничены: при переполнении
+    Application перестаёт забирать update_queue, и давление доходит до источника.
+    """
+
+    def __init__(self, shards: int = 8, shard_queue_size: int = 100):
+        # Application передаёт обновления по одному: параллелизм обеспечивают шарды
+        super().__init__(max_concurrent_updates=1)
+        self.shards = shards
+        self.shard_queue_size = shard_queue_size
+        self._queues = []
+        self._workers = []
+
+    @staticmethod
+    def shard_key(update: object) -> int:
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return update.effective_user.id
+            return update.update_id
+        return 0
+
+    def shard_for(self, update: object) -> int:
+        return hash(self.shard_key(update)) % self.shards
+
+    async def initialize(self) -> None:
+        self._queues = [asyncio.Queue(maxsize=self.shard_queue_size) for _ in range(self.shards)]
+        self._workers = [
+            asyncio.create_task(self._worker(index), name=f'update-shard-{index}')
+            for index in range(self.shards)
+        ]
+        logger.info(f"Запущено {self.shards} шардов обработки обновлений")
+
+    async def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        # Необработанные корутины закрываем, чтобы не было предупреждений "never awaited"
+        for queue in self._queues:
+            while not queue.empty():
+                queue.get_nowait().close()
+        self._workers = []
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        await self._queues[self.shard_for(update)].put(coroutine)
+
+    async def _worker(self, index: int) -> None:
+        queue = self._queues[index]
+        while True:
+            coroutine = await queue.get()
+            started = time.perf_counter()
+            try:
+                await coroutine
+            except Exception as e:
+                logger.error(f"Ошибка обработки обновления в шарде {index}: {e}", exc_info=True)
+            finally:
+                metrics.bot_update_duration.observe(time.perf_counter() - started, str(index))
+                queue.task_done()
+
+    def depths(self) -> list:
+        """Текущая длина очереди каждого шарда"""
+        return [queue.qsize() for queue in self._queues]
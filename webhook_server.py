@@ -0,0 +1,158 @@
+import asyncio
+import hmac
+import json
+import logging
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    orjson = None
+    loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+# Через сколько секунд Telegram стоит повторить доставку при перегрузке
+RETRY_AFTER_SECONDS = 1
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 411: 'Length Required', 413: 'Payload Too Large',
+           429: 'Too Many Requests', 431: 'Request Header Fields Too Large'}
+
+
+def webhook_response(status: int):
+    """Ответ Flask-обработчика /webhook по статусу постановки обновления в очередь"""
+    if status == 200:
+        return "OK", 200
+    if status == 429:
+        return "Too Many Requests", 429, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+    if status == 400:
+        return "Bad Request", 400
+    return "Bot is not running", 503
+
+
+def decode_update(body: bytes, bot):
+    """Быстрый разбор JSON (orjson, если установлен) в telegram.Update.
+    Любое тело, которое не удаётся превратить в Update, — ValueError"""
+    # Импорт здесь: webhook_response нужен воркерам сайта, которым python-telegram-bot не нужен
+    from telegram import Update
+    data = loads(body)
+    if not isinstance(data, dict) or 'update_id' not in data:
+        raise ValueError("Тело запроса не является обновлением Telegram")
+    try:
+        return Update.de_json(data, bot)
+    except Exception as e:
+        # de_json не проверяет структуру: на чужом JSON бросает KeyError, TypeError,
+        # AttributeError, а на огромной дате — OverflowError/OSError
+        raise ValueError(f"Обновление Telegram не разобрано: {e!r}") from e
+
+
+class WebhookReceiver:
+    """Минимальный асинхронный HTTP-приёмник вебхуков Telegram в цикле событий бота.
+
+    Обновление кладётся прямо в application.update_queue без ожидания: если очередь
+    заполнена, отвечаем 429, и Telegram повторит доставку позже. Ответ уходит сразу
+    после разбора JSON, поэтому Telegram не ждёт обработки и не шлёт повторы из-за таймаута.
+    """
+
+    def __init__(self, application, secret_token: str, host: str = '0.0.0.0', port: int = 8443,
+                 path: str = '/webhook'):
+        self.application = application
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+        self.accepted = 0
+        self.rejected = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"Приёмник вебхуков слушает {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def enqueue(self, body: bytes) -> int:
+        """Разбирает тело запроса и ставит обновление в очередь; возвращает HTTP-статус"""
+        try:
+            update = decode_update(body, self.application.bot)
+        except ValueError as e:
+            logger.warning(f"Не удалось разобрать вебхук: {e!r}")
+            return 400
+        try:
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return 429
+        self.accepted += 1
+        return 200
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                keep_alive = await self._handle_request(reader, writer)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка приёмника вебхуков: {e}", exc_info=True)
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            await self._respond(writer, 431, keep_alive=False)
+            return False
+        if len(head) > MAX_HEADER_BYTES:
+            await self._respond(writer, 431, keep_alive=False)
+            return False
+
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        method, target, version = (request_line.split(' ', 2) + ['', ''])[:3]
+        headers = {}
+        for line in header_lines:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+        length = headers.get('content-length', '0')
+        if 'transfer-encoding' in headers or not length.isdigit():
+            await self._respond(writer, 411, keep_alive=False)
+            return False
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            await self._respond(writer, 413, keep_alive=False)
+            return False
+        body = await reader.readexactly(length)
+
+        if target.split('?', 1)[0] != self.path:
+            status = 404
+        elif method != 'POST':
+            status = 405
+        elif not hmac.compare_digest(headers.get('x-telegram-bot-api-secret-token', ''), self.secret_token or ''):
+            status = 403
+        else:
+            status = self.enqueue(body)
+
+        await self._respond(writer, status, keep_alive)
+        return keep_alive
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, keep_alive: bool):
+        extra = f'Retry-After: {RETRY_AFTER_SECONDS}\r\n' if status == 429 else ''
+        connection = 'keep-alive' if keep_alive else 'close'
+        writer.write(
+            f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+            f'Content-Length: 0\r\nConnection: {connection}\r\n{extra}\r\n'.encode('latin-1')
+        )
+        await writer.drain()
@@ -0,0 +1,64 @@
+"""
+WSGI-приложение для воркеров gunicorn (см. server.py): только сайт, без бота.
+
+Вебхуки Telegram, пришедшие в любой воркер, пересылаются в процесс бота на локальный
+приёмник WebhookReceiver; ответ бота (200/429/400) возвращается Telegram как есть.
+"""
+import os
+import hmac
+import logging
+import requests
+from flask import request, jsonify
+from dotenv import load_dotenv
+
+import repository
+import ratelimit
+from app import create_app
+from webhook_server import webhook_response
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+# Адрес приёмника вебхуков в процессе бота; server.py передаёт его воркерам через окружение
+BOT_FORWARD_URL = os.getenv('BOT_FORWARD_URL', 'http://127.0.0.1:8443/webhook')
+BOT_FORWARD_TIMEOUT = float(os.getenv('BOT_FORWARD_TIMEOUT', '5'))
+
+app = create_app()
+
+# Keep-alive соединения с процессом бота, общие для потоков воркера
+forward_session = requests.Session()
+
+
+@app.route('/webhook', methods=['POST'])
+def telegram_webhook():
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(secret, WEBHOOK_SECRET or ''):
+        return "Unauthorized", 403
+
+    try:
+        response = forward_session.post(
+            BOT_FORWARD_URL,
+            data=request.get_data(),
+            headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret},
+            timeout=BOT_FORWARD_TIMEOUT
+        )
+        status = response.status_code
+    except requests.RequestException as e:
+        logger.warning(f"Процесс бота недоступен: {e}")
+        status = 503
+    return webhook_response(status)
+
+
+@app.route('/healthcheck', methods=['GET'])
+def healthcheck():
+    """Эндпоинт для проверки работоспособности воркера"""
+    return jsonify({
+        "status": "ok",
+        "mode": "prefork",
+        "worker_pid": os.getpid(),
+        "client_cache": repository.client_cache.stats(),
+        "order_writer": repository.order_writer.stats(),
+        "rate_limits": ratelimit.stats()
+    }), 200